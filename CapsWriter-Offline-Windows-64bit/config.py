@@ -8,21 +8,30 @@ class ServerConfig:
     port = '6016'
 
     format_num = True  # 输出时是否将中文数字转为阿拉伯数字
+    format_num_idioms = 'idioms.txt'  # 额外的常用语文件，以空白分隔，其中的数字不转换，如「一五一十」
     format_punc = True  # 输出时是否启用标点符号引擎
     format_spell = True  # 输出时是否调整中英之间的空格
 
+    batch_size = 4       # 识别进程一次最多合并推理几个片段，1 表示逐个识别
+    batch_wait = 0.02    # 收到第一个片段后，最多再等这么多秒凑齐一批
+
 
 # 客户端配置
 class ClientConfig:
     # HTTP 后端地址（默认指向局域网 FunASR 服务）
     backend_url = 'http://192.168.100.38:8000'
     http_timeout = 60
+    http_pool_size = 4          # 每个后端地址最多保留的空闲长连接数
+    http_pool_idle = 30         # 空闲连接超过多少秒未使用就关闭
 
     # 接口模式：transcribe / optimize / translate
     api_mode = 'optimize'
     api_mode_cycle = ['optimize', 'transcribe', 'translate']
     mode_hotkey = 'alt+windows'
     use_stream_api = False
+    upload_codec = 'wav'        # 上传音频的编码：wav / flac / opus，flac 和 opus 需要 ffmpeg，后端拒绝时自动改回 wav
+    opus_bitrate = '24k'        # opus 编码的码率
+    progressive_upload = False  # 边录边传：录音时就以 chunked 请求把音频传给后端，需要后端支持 chunked 上传，总是以 wav 发送
 
     addr = '127.0.0.1'          # Server 地址
     port = '6016'               # Server 端口
@@ -35,9 +44,16 @@ class ClientConfig:
     suppress     = False        # 是否阻塞按键事件（让其它程序收不到这个按键消息）
     restore_key  = True         # 录音完成，松开按键后，是否自动再按一遍，以恢复 CapsLock 或 Shift 等按键之前的状态
     threshold    = 0.3          # 按下快捷键后，触发语音识别的时间阈值
+    preroll      = 0.3          # 预录音：空闲时保留最近这么多秒的音频，按下快捷键时补在录音开头，不超过 10 秒
     paste        = True         # 是否以写入剪切板然后模拟 Ctrl-V 粘贴的方式输出结果
     restore_clip = True         # 模拟粘贴后是否恢复剪贴板
 
+    vad_trim = True             # 上传前裁掉录音首尾的静音，整段都是静音时不发请求
+    vad_pad = 0.2               # 裁剪时在人声两端保留的余量（秒）
+    vad_max_pause = 0           # 大于 0 时，把中间超过这么多秒的停顿压缩到这个长度
+    vad_webrtc = True           # 安装了 webrtcvad 时用它判断人声，否则用能量和过零率
+    vad_aggressiveness = 2      # webrtcvad 的激进程度，0~3，越大越容易判为静音
+
     save_audio = True           # 是否保存录音文件
     audio_name_len = 20         # 将录音识别结果的前多少个字存储到录音文件名中，建议不要超过200
 
@@ -46,14 +62,25 @@ class ClientConfig:
     hot_zh = True               # 是否启用中文热词替换，中文热词存储在 hot_zh.txt 文件里
     多音字 = True                  # True 表示多音字匹配
     声调  = False                 # False 表示忽略声调区别，这样「黄章」就能匹配「慌张」
+    模糊音 = False                # True 表示容忍平翘舌、前后鼻音、n/l 不分，这样「撒贝林」也能匹配「撒贝宁」
 
     hot_en   = True             # 是否启用英文热词替换，英文热词存储在 hot_en.txt 文件里
     hot_rule = True             # 是否启用自定义规则替换，自定义规则存储在 hot_rule.txt 文件里
     hot_kwd  = True             # 是否启用关键词日记功能，自定义关键词存储在 keyword.txt 文件里
+    hot_cache = True            # 缓存编译好的中文热词索引，热词文件不变时启动不再重新计算拼音
+    hot_cache_dir = 'cache'     # 热词索引缓存目录
 
     mic_seg_duration = 15           # 麦克风听写时分段长度：15秒
     mic_seg_overlap = 2             # 麦克风听写时分段重叠：2秒
 
+    file_decode_workers = 2          # 批量转录文件时，同时用 ffmpeg 解码的进程数
+    file_upload_workers = 2          # 批量转录文件时，同时上传到后端的请求数
+    file_post_workers = 2            # 批量转录文件时，同时做热词替换和写文件的任务数
+    transcribe_cache = True          # 转录文件时缓存后端结果，同一音频重跑不再上传
+    transcribe_cache_dir = 'cache'   # 缓存目录
+    transcribe_cache_size = 512      # 缓存总大小上限（MB），超出后淘汰最久未用的
+
+    file_segment = True              # transcribe 模式转录文件时边解码边分段上传，长音视频不必整个读进内存
     file_seg_duration = 25           # 转录文件时分段长度
     file_seg_overlap = 2             # 转录文件时分段重叠
 
@@ -4,6 +4,21 @@
 使用正则表达式进行匹配和替换，
 可能不是那么精准，但足够应付大部分情景了。
 
+大部分句子里根本没有中文数字，先用一个字符类快速判断，没有就原样返回。
+成语、常用语（如「乱七八糟」）里的数字不转换，它们建成一个 Aho-Corasick 自动机，
+每个句子只扫描一遍，得到所有常用语出现的位置，之后每处匹配只需二分查找。
+常用语可以用 load_idioms 从文件追加，数量多少不影响每句的耗时。
+
+批量转换归档的转录稿时用 chinese_to_num_batch，输入列表或迭代器，按原顺序逐句产出，
+workers 大于 1 时用多进程，子进程会带上当前的常用语。
+
+assets/chinese_itn_corpus.txt 是回归语料，每行「原文<Tab>期望结果」。直接运行本模块会
+逐句比对期望结果、列出不一致的句子，并报告单进程与多进程的每秒句数：
+
+    python -m util.chinese_itn [--workers 4] [--update]
+
+--update 用当前的转换结果重写期望结果，只应在确认改动符合预期后使用。
+
 用法示例：
 
 from chinese_itn import chinese_to_num
@@ -13,9 +28,13 @@ print(res)  # 192.168.1.1
 
 '''
 
-__all__ = ['chinese_to_num']
+__all__ = ['chinese_to_num', 'chinese_to_num_batch', 'load_idioms', 'has_numeral']
 
 import re
+from bisect import bisect_left
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterable, Iterator
 from string import ascii_letters
 
 
@@ -35,6 +54,74 @@ idioms = '''
 
 idioms = [x.strip() for x in idioms.split() ]
 
+# 快速判断：没有这些字就不可能有需要转换的数字
+has_numeral = re.compile('[零幺一二两三四五六七八九十]')
+
+
+class IdiomIndex:
+    '''常用语的 Aho-Corasick 自动机，按字符转移'''
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]         # 每个状态结束的常用语长度
+        for word in words:
+            state = 0
+            for c in word:
+                nxt = self.goto[state].get(c)
+                if nxt is None:
+                    nxt = self.goto[state][c] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = nxt
+            if len(word) not in self.out[state]:
+                self.out[state] += (len(word),)
+
+        # 按层建失败指针，输出合并上失败状态的输出
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for c, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(c, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def starts(self, string):
+        '''返回句子中所有常用语出现的起点，升序'''
+        found = set()
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, c in enumerate(string):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for length in out[state]:
+                found.add(i + 1 - length)
+        return sorted(found)
+
+
+idiom_index = IdiomIndex(idioms)
+
+
+def load_idioms(file):
+    '''
+    从文件追加常用语，以空白分隔，# 开头的行是注释，返回常用语总数
+
+    重建自动机后整体替换引用，正在转换的句子仍用旧的
+    '''
+    global idioms, idiom_index
+    file = Path(file)
+    if not file.exists():
+        return len(idioms)
+    with open(file, 'r', encoding='utf-8') as f:
+        words = [word for line in f if not line.strip().startswith('#') for word in line.split()]
+    new_idioms = list(dict.fromkeys(idioms + words))
+    idioms, idiom_index = new_idioms, IdiomIndex(new_idioms)
+    return len(idioms)
+
 # 总模式，筛选出可能需要替换的内容
 # 测试链接  https://regex101.com/r/tFqg9S/3
 pattern = re.compile(f"""(?ix)          # i 表示忽略大小写，x 表示开启注释模式
@@ -222,37 +309,41 @@ def convert_date_value(original):
     ...
 
 
-def replace(original):
+# 依次尝试的数字类型：(名称, 必须包含的字, 正则, 是否先去掉单位, 转换函数)
+# 不含必需字的类型不可能匹配，直接跳过，不再调用 fullmatch
+classifiers = [
+    ('纯数字', '', pure_num, True, convert_pure_num),
+    ('数值', '', value_num, True, convert_value_num),
+    ('百分之数值', '百分之', percent_value, False, convert_percent_value),
+    ('分数', '分之', fraction_value, False, convert_fraction_value),
+    ('比值', '比', ratio_value, False, convert_ratio_value),
+    ('时间', '点', time_value, False, convert_time_value),
+    ('日期', '月', data_value, False, convert_date_value),
+]
+
+
+def in_idiom(starts, l_pos, r_pos):
+    '''是否有常用语从 [l_pos, r_pos) 之间开始'''
+    i = bisect_left(starts, l_pos)
+    return i < len(starts) and starts[i] < r_pos
+
+
+def replace(original, idiom_starts=None):
     string = original.string
     l_pos, r_pos = original.regs[2]; l_pos = max(l_pos-2, 0)
     head = original.group(1)
     original = original.group(2)
+    if idiom_starts is None:
+        idiom_starts = idiom_index.starts(string)
     try:
-        if idioms and any([string.find(idiom) in range(l_pos, r_pos) for idiom in idioms]):
-            final = original
-        elif pure_num.fullmatch(original.strip(common_units)):
-            num_type = '纯数字'
-            final = convert_pure_num(original)
-        elif value_num.fullmatch(original.strip(common_units)):
-            num_type = '数值'
-            final = convert_value_num(original)
-        elif percent_value.fullmatch(original):
-            num_type = '百分之数值'
-            final = convert_percent_value(original)
-        elif fraction_value.fullmatch(original):
-            num_type = '分数'
-            final = convert_fraction_value(original)
-        elif ratio_value.fullmatch(original):
-            num_type = '比值'
-            final = convert_ratio_value(original)
-        elif time_value.fullmatch(original):
-            num_type = '时间'
-            final = convert_time_value(original)
-        elif data_value.fullmatch(original):
-            num_type = '日期'
-            final = convert_date_value(original)
-        else:
-            final = original
+        final = original
+        if not in_idiom(idiom_starts, l_pos, r_pos):
+            for num_type, marker, regex, strip, convert in classifiers:
+                if marker not in original:
+                    continue
+                if regex.fullmatch(original.strip(common_units) if strip else original):
+                    final = convert(original)
+                    break
 
         if head:
             final = head + final
@@ -263,34 +354,84 @@ def replace(original):
 
 
 def chinese_to_num(original):
-    return pattern.sub(replace, original)
+    if not has_numeral.search(original):
+        return original
+    starts = idiom_index.starts(original)       # 每句只扫描一遍常用语
+    return pattern.sub(lambda m: replace(m, starts), original)
+
+
+def _init_worker(words):
+    # 子进程（Windows 上是重新启动的进程）使用与主进程相同的常用语
+    global idioms, idiom_index
+    idioms, idiom_index = words, IdiomIndex(words)
+
+
+def chinese_to_num_batch(sentences: Iterable[str], workers: int = 1, chunksize: int = 1024) -> Iterator[str]:
+    '''
+    逐句转换，按输入顺序产出结果，输入可以是列表，也可以是逐行读文件这样的迭代器
+
+    workers 大于 1 时分给多个进程，每次给子进程发 chunksize 句，适合成千上万句的语料
+    '''
+    if workers <= 1:
+        for sentence in sentences:
+            yield chinese_to_num(sentence)
+        return
+    with Pool(workers, initializer=_init_worker, initargs=(idioms,)) as pool:
+        yield from pool.imap(chinese_to_num, sentences, chunksize)
+
+
+corpus_file = Path(__file__).parent.parent / 'assets' / 'chinese_itn_corpus.txt'
+
+
+def _read_corpus(file):
+    pairs = []
+    with open(file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'): continue
+            original, _, expected = line.partition('\t')
+            pairs.append((original, expected))
+    return pairs
+
+
+def _regression(workers, update):
+    import time
+
+    pairs = _read_corpus(corpus_file)
+    originals = [original for original, _ in pairs]
+
+    answers = list(chinese_to_num_batch(originals))
+    diffs = [(o, e, a) for (o, e), a in zip(pairs, answers) if e != a]
+    for original, expected, answer in diffs:
+        print(f'\n{original=}')
+        print(f'{expected=}')
+        print(f'{answer=  }')
+    print(f'\n回归语料 {len(pairs)} 句，不一致 {len(diffs)} 句')
+
+    if update:
+        with open(corpus_file, 'r', encoding='utf-8') as f:
+            header = [line for line in f if line.startswith('#')]
+        with open(corpus_file, 'w', encoding='utf-8', newline='\n') as f:
+            f.writelines(header)
+            f.writelines(f'{o}\t{a}\n' for o, a in zip(originals, answers))
+        print(f'已用当前结果更新 {corpus_file}')
+
+    # 吞吐量：把语料重复到足够多的句数
+    sentences = originals * max(1, 50000 // len(originals))
+    for n in sorted({1, workers}):
+        t1 = time.perf_counter()
+        for _ in chinese_to_num_batch(sentences, workers=n):
+            pass
+        t2 = time.perf_counter()
+        print(f'{n} 个进程：{len(sentences)} 句，{len(sentences) / (t2 - t1):,.0f} 句/秒')
+    return not diffs
 
 if __name__ == "__main__":
+    import sys
+    from os import cpu_count
 
-    # groups = []
-    # with open('./old/测试集.txt', 'r', encoding="utf-8", newline='') as f:
-    #     lines = f.readlines()
-    #     for i in range(0, len(lines), 5):
-    #         original = lines[i].split(maxsplit=2)[1]
-    #         reult = lines[i+1].split(maxsplit=2)[1]
-    #         groups.append([original, reult])
-
-    # for g in groups:
-    #     original = g[0]
-    #     reference = g[1]
-    #     answer = chinese_to_num(original)
-    #     print(f'\n{original=}')
-    #     print(f'{reference=}') 
-    #     print(f'{answer=   }') 
-
-    # file = './old/汉语词语.txt'
-    # with open(file, 'r', encoding='utf-8') as f:
-    #     words = f.readlines()
-
-    # for word in words: 
-    #     new = chinese_to_num(word)
-    #     if re.match(r'.*\d.+', new):
-    #         print(word, new)
+    workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else (cpu_count() or 1)
     print(chinese_to_num('二零二五年十月'))
     print(chinese_to_num('乱七八糟'))
-
+    if not _regression(workers, '--update' in sys.argv):
+        sys.exit(1)
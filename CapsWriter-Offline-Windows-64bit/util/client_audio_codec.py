@@ -0,0 +1,231 @@
+import io
+import shutil
+import struct
+import subprocess
+import time
+import wave
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Union
+
+import numpy as np
+
+from config import ClientConfig as Config
+
+
+'''
+上传音频的编码器。
+
+所有编码器的输入都是 16 kHz、单声道、int16 的 PCM，输出上传用的字节：
+
+- wav：不压缩，约 32 KB/s，任何后端都能接收
+- flac：无损压缩，通常只有 WAV 的一半左右
+- opus：低码率有损压缩（ClientConfig.opus_bitrate），适合 Wi-Fi、VPN 等慢速链路
+
+通过 ClientConfig.upload_codec 选择。flac、opus 依赖 ffmpeg，没有 ffmpeg 时自动用 wav；
+后端拒绝某个格式（HTTP 400/415/422）时，本次改用 wav 重发，并在本次运行期间不再使用该格式。
+
+输入是映射磁盘临时文件的 memmap（转录长文件时）且用 wav 上传时，不拼出完整的 WAV 字节，
+而是逐块转换、边读边发，整个上传过程不需要把音频读进内存。总长度事先已知，
+请求带 Content-Length，不依赖后端对 chunked 上传的支持。
+
+直接运行本模块可以对比各编码的体积与耗时：
+
+    python -m util.client_audio_codec 录音.wav [--upload]
+'''
+
+
+__all__ = ['get_encoder', 'post_with_fallback', 'stream_wav_header', 'wav_bytes', 'wav_chunks']
+
+
+SAMPLE_RATE = 16000
+REJECT_STATUS = {400, 415, 422}
+STREAM_CHUNK = SAMPLE_RATE * 10     # 流式上传时每块的采样数
+
+_rejected: Set[str] = set()
+
+
+def wav_bytes(pcm: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(pcm.astype('<i2', copy=False).tobytes())
+    return buffer.getvalue()
+
+
+def stream_wav_header(samples: int = None) -> bytes:
+    # 总长度未知时，数据长度按 WAV 惯例填 0xFFFFFFFF，表示读到流结束为止
+    data_size = 0xFFFFFFFF if samples is None else samples * 2
+    riff_size = 0xFFFFFFFF if samples is None else data_size + 36
+    return b''.join([
+        b'RIFF', struct.pack('<I', riff_size), b'WAVE',
+        b'fmt ', struct.pack('<IHHIIHH', 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16),
+        b'data', struct.pack('<I', data_size),
+    ])
+
+
+class WavChunks:
+    '''
+    逐块产出完整的 WAV 文件内容，每次只转换一块
+
+    len() 是 WAV 的总字节数，上传时据此带上 Content-Length，不必用 chunked 编码
+    '''
+
+    def __init__(self, pcm: np.ndarray):
+        self.pcm = pcm
+
+    def __len__(self) -> int:
+        return 44 + len(self.pcm) * 2
+
+    def __iter__(self) -> Iterator[bytes]:
+        pcm = self.pcm
+        yield stream_wav_header(len(pcm))
+        for i in range(0, len(pcm), STREAM_CHUNK):
+            yield pcm[i:i + STREAM_CHUNK].astype('<i2', copy=False).tobytes()
+
+
+def wav_chunks(pcm: np.ndarray) -> WavChunks:
+    return WavChunks(pcm)
+
+
+class Encoder:
+    name = 'wav'
+    suffix = '.wav'
+    mimetype = 'audio/wav'
+
+    def available(self) -> bool:
+        return True
+
+    def encode(self, pcm: np.ndarray) -> bytes:
+        return wav_bytes(pcm)
+
+    def payload(self, pcm: np.ndarray) -> Union[bytes, Iterable[bytes]]:
+        '''上传用的请求体，磁盘上的长音频返回按块产生的迭代器'''
+        if isinstance(pcm, np.memmap) and len(pcm) > STREAM_CHUNK:
+            return wav_chunks(pcm)
+        return self.encode(pcm)
+
+
+class FfmpegEncoder(Encoder):
+    def __init__(self, name: str, suffix: str, mimetype: str, args: Callable[[], List[str]]):
+        self.name = name
+        self.suffix = suffix
+        self.mimetype = mimetype
+        self._args = args
+
+    def available(self) -> bool:
+        return shutil.which('ffmpeg') is not None
+
+    def encode(self, pcm: np.ndarray) -> bytes:
+        ffmpeg_cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 's16le', '-ar', f'{SAMPLE_RATE}', '-ac', '1', '-i', '-',
+            *self._args(),
+            '-',
+        ]
+        process = subprocess.run(
+            ffmpeg_cmd,
+            input=pcm.astype('<i2', copy=False).tobytes(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if process.returncode != 0 or not process.stdout:
+            detail = process.stderr.decode('utf-8', errors='ignore').strip()
+            raise RuntimeError(f'ffmpeg 编码 {self.name} 失败：{detail}')
+        return process.stdout
+
+    def payload(self, pcm: np.ndarray) -> Union[bytes, Iterable[bytes]]:
+        return self.encode(pcm)
+
+
+ENCODERS: Dict[str, Encoder] = {
+    'wav': Encoder(),
+    'flac': FfmpegEncoder('flac', '.flac', 'audio/flac', lambda: ['-c:a', 'flac', '-f', 'flac']),
+    'opus': FfmpegEncoder('opus', '.ogg', 'audio/ogg', lambda: [
+        '-c:a', 'libopus',
+        '-b:a', getattr(Config, 'opus_bitrate', '24k'),
+        '-application', 'voip',
+        '-f', 'ogg',
+    ]),
+}
+
+
+def get_encoder(name: str = None) -> Encoder:
+    name = (name or getattr(Config, 'upload_codec', 'wav')).lower()
+    encoder = ENCODERS.get(name)
+    if encoder is None or name in _rejected or not encoder.available():
+        return ENCODERS['wav']
+    return encoder
+
+
+def _is_format_rejected(exc: Exception) -> bool:
+    return getattr(exc, 'status', None) in REJECT_STATUS
+
+
+def post_with_fallback(post, mode: str, pcm: np.ndarray, filename: str):
+    '''
+    按配置的格式编码并调用 post(mode, audio, filename, mimetype)，
+    后端拒绝该格式时记下来，改用 WAV 重发
+    '''
+    encoder = get_encoder()
+    stem = filename.rsplit('.', 1)[0] if '.' in filename else filename
+    try:
+        payload = encoder.payload(pcm)
+    except RuntimeError:
+        _rejected.add(encoder.name)
+        encoder = ENCODERS['wav']
+        payload = encoder.payload(pcm)
+
+    try:
+        return post(mode, payload, stem + encoder.suffix, encoder.mimetype)
+    except RuntimeError as e:
+        if encoder.name == 'wav' or not _is_format_rejected(e):
+            raise
+        _rejected.add(encoder.name)
+
+    wav = ENCODERS['wav']
+    return post(mode, wav.payload(pcm), stem + wav.suffix, wav.mimetype)
+
+
+def _report(file: str, upload: bool):
+    from util.client_backend_http import post_audio
+
+    with wave.open(file, 'rb') as wf:
+        if wf.getframerate() != SAMPLE_RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise SystemExit('请提供 16 kHz、单声道、16 位的 WAV 文件')
+        pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2')
+
+    duration = len(pcm) / SAMPLE_RATE
+    wav_size = None
+    print(f'音频时长 {duration:.2f}s\n')
+    print(f'{"编码":<6}{"体积":>10}{"比例":>8}{"编码耗时":>10}'
+          f'{"1Mbps":>9}{"10Mbps":>9}{"100Mbps":>9}' + (f'{"实测往返":>10}' if upload else ''))
+    for name, encoder in ENCODERS.items():
+        if not encoder.available():
+            print(f'{name:<6}  需要 ffmpeg')
+            continue
+        t1 = time.perf_counter()
+        payload = encoder.encode(pcm)
+        t2 = time.perf_counter()
+        size = len(payload)
+        wav_size = wav_size or size
+        row = f'{name:<6}{size / 1024:>8.1f}KB{size / wav_size:>8.0%}{(t2 - t1) * 1000:>8.1f}ms'
+        for mbps in (1, 10, 100):
+            row += f'{size * 8 / (mbps * 1e6) * 1000:>7.0f}ms'
+        if upload:
+            t1 = time.perf_counter()
+            try:
+                post_audio('transcribe', payload, 'report' + encoder.suffix, encoder.mimetype)
+                row += f'{(time.perf_counter() - t1) * 1000:>8.0f}ms'
+            except RuntimeError as e:
+                row += f'  失败：{e}'
+        print(row)
+
+
+if __name__ == '__main__':
+    import sys
+
+    args = [x for x in sys.argv[1:] if not x.startswith('--')]
+    if not args:
+        raise SystemExit('用法：python -m util.client_audio_codec 录音.wav [--upload]')
+    _report(args[0], '--upload' in sys.argv)
@@ -1,10 +1,16 @@
+import http.client
 import json
 import uuid
-import urllib.error
-import urllib.request
-from typing import Iterator
+from typing import Iterable, Iterator, Union
 
 from config import ClientConfig as Config
+from util.client_http_pool import pool
+
+
+class BackendHTTPError(RuntimeError):
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"HTTP {status}: {detail}")
+        self.status = status
 
 
 def _base_url() -> str:
@@ -47,19 +53,79 @@ def _encode_multipart(fields, files):
     return data, headers
 
 
-def _request(url, data, headers=None, method="POST"):
-    req = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+def _encode_multipart_stream(fields, name, filename, chunks: Iterable[bytes], mimetype):
+    """
+    与 _encode_multipart 相同的表单，但文件内容来自迭代器，边产生边发送
+
+    chunks 有 len()（总字节数已知）时带上 Content-Length 直接发送，
+    否则以 chunked 方式发送，只有部分后端接受
+    """
+    boundary = f"----CapsWriter{uuid.uuid4().hex}"
+    boundary_bytes = boundary.encode("utf-8")
+    head = []
+    for field, value in fields.items():
+        if value is None:
+            continue
+        head.extend([
+            b"--" + boundary_bytes,
+            f'Content-Disposition: form-data; name="{field}"'.encode("utf-8"),
+            b"",
+            value.encode("utf-8") if isinstance(value, str) else value,
+        ])
+    head.extend([
+        b"--" + boundary_bytes,
+        f'Content-Disposition: form-data; name="{name}"; filename="{filename}"'.encode("utf-8"),
+        f"Content-Type: {mimetype}".encode("utf-8"),
+        b"",
+        b"",
+    ])
+
+    head = b"\r\n".join(head)
+    tail = b"\r\n--" + boundary_bytes + b"--\r\n"
+
+    def body():
+        yield head
+        for chunk in chunks:
+            # 空块在 chunked 编码里表示结束，必须跳过
+            if chunk:
+                yield chunk
+        yield tail
+
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    if hasattr(chunks, "__len__"):
+        headers["Content-Length"] = str(len(head) + len(chunks) + len(tail))
+    return body(), headers
+
+
+def _encode_audio(fields, filename, audio: Union[bytes, Iterable[bytes]], mimetype: str):
+    if isinstance(audio, (bytes, bytearray)):
+        return _encode_multipart(fields, {
+            "audio": (filename, audio, mimetype),
+        })
+    return _encode_multipart_stream(fields, "audio", filename, audio, mimetype)
+
+
+def _open(url, data, headers=None, method="POST"):
     timeout = getattr(Config, "http_timeout", 60)
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            charset = resp.headers.get_content_charset() or "utf-8"
+        resp = pool.urlopen(method, url, body=data, headers=headers, timeout=timeout)
+    except (OSError, http.client.HTTPException) as e:
+        raise RuntimeError(f"请求后端失败: {e}") from e
+    if resp.status >= 400:
+        with resp:
+            detail = resp.read().decode("utf-8", errors="ignore")
+        raise BackendHTTPError(resp.status, detail)
+    return resp
+
+
+def _request(url, data, headers=None, method="POST"):
+    with _open(url, data, headers=headers, method=method) as resp:
+        charset = resp.headers.get_content_charset() or "utf-8"
+        try:
             raw = resp.read().decode(charset)
-            return json.loads(raw)
-    except urllib.error.HTTPError as e:
-        detail = e.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"HTTP {e.code}: {detail}") from e
-    except urllib.error.URLError as e:
-        raise RuntimeError(f"请求后端失败: {e.reason}") from e
+        except (OSError, http.client.HTTPException) as e:
+            raise RuntimeError(f"请求后端失败: {e}") from e
+    return json.loads(raw)
 
 
 def _resolve_endpoint(mode: str) -> str:
@@ -71,7 +137,8 @@ def _resolve_endpoint(mode: str) -> str:
     return "/api/asr/transcribe"
 
 
-def post_audio(mode: str, audio_bytes: bytes, filename: str = "audio.wav") -> dict:
+def post_audio(mode: str, audio: Union[bytes, Iterable[bytes]], filename: str = "audio.wav",
+               mimetype: str = "audio/wav") -> dict:
     endpoint = _resolve_endpoint(mode)
     url = _base_url() + endpoint
 
@@ -83,9 +150,7 @@ def post_audio(mode: str, audio_bytes: bytes, filename: str = "audio.wav") -> di
             "hotword": "",
         })
 
-    data, headers = _encode_multipart(fields, {
-        "audio": (filename, audio_bytes, "audio/wav"),
-    })
+    data, headers = _encode_audio(fields, filename, audio, mimetype)
     return _request(url, data, headers=headers)
 
 
@@ -103,7 +168,8 @@ def post_optimize(text: str, mode: str = "optimize") -> dict:
     return _request(url, payload, headers=headers)
 
 
-def post_audio_stream(mode: str, audio_bytes: bytes, filename: str = "audio.wav") -> Iterator[dict]:
+def post_audio_stream(mode: str, audio: Union[bytes, Iterable[bytes]], filename: str = "audio.wav",
+                      mimetype: str = "audio/wav") -> Iterator[dict]:
     url = _base_url() + "/api/asr/transcribe-and-optimize-stream"
     mode_key = (mode or getattr(Config, "api_mode", "optimize")).lower()
     optimize_mode = {
@@ -116,19 +182,13 @@ def post_audio_stream(mode: str, audio_bytes: bytes, filename: str = "audio.wav"
         "hotword": "",
         "optimize_mode": optimize_mode,
     }
-    data, headers = _encode_multipart(fields, {
-        "audio": (filename, audio_bytes, "audio/wav"),
-    })
+    data, headers = _encode_audio(fields, filename, audio, mimetype)
     headers["Accept"] = "text/event-stream"
 
-    req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-    timeout = getattr(Config, "http_timeout", 60)
-    try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            charset = resp.headers.get_content_charset() or "utf-8"
+    with _open(url, data, headers=headers) as resp:
+        charset = resp.headers.get_content_charset() or "utf-8"
+        try:
             for raw_line in resp:
-                if not raw_line:
-                    continue
                 line = raw_line.decode(charset, errors="ignore").strip()
                 if not line or not line.startswith("data:"):
                     continue
@@ -139,8 +199,5 @@ def post_audio_stream(mode: str, audio_bytes: bytes, filename: str = "audio.wav"
                     yield json.loads(data_str)
                 except json.JSONDecodeError:
                     continue
-    except urllib.error.HTTPError as e:
-        detail = e.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"HTTP {e.code}: {detail}") from e
-    except urllib.error.URLError as e:
-        raise RuntimeError(f"请求后端失败: {e.reason}") from e
+        except (OSError, http.client.HTTPException) as e:
+            raise RuntimeError(f"请求后端失败: {e}") from e
@@ -5,6 +5,8 @@ import sys
 from pathlib import Path
 from typing import List, Union
 
+from util.client_ring_buffer import AudioRingBuffer
+
 from rich.console import Console 
 from rich.theme import Theme
 my_theme = Theme({'markdown.code':'cyan', 'markdown.item.number':'yellow'})
@@ -20,5 +22,6 @@ class Cosmic:
     loop: Union[None, AbstractEventLoop] = None
     audio_files = {}
     stream: Union[None, sd.InputStream] = None
+    ring: Union[None, AudioRingBuffer] = None
     kwd_list: List[str] = []
     api_mode = getattr(Config, 'api_mode', 'optimize')
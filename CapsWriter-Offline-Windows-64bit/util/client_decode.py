@@ -0,0 +1,156 @@
+import hashlib
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+
+
+'''
+用 ffmpeg 把音视频流式解码为 16 kHz、单声道、int16 的 PCM。
+
+decode_frames 是一个生成器，每次从 ffmpeg 的管道里读出固定长度的一帧，
+由 ffmpeg 直接输出 s16le，不再经过 float32 中转和截断，
+调用方拿到一帧就处理一帧（分段、写入临时文件、计算哈希），内存占用与文件时长无关。
+
+spool_pcm 把整个文件解码到磁盘上的临时文件，再以 memmap 的形式交给上传，
+用于不分段转录时既要先算缓存键、又要整段上传的场景。
+
+直接运行本模块可以对比「整个读入」与「流式解码」在不同时长下的峰值内存：
+
+    python -m util.client_decode
+'''
+
+
+__all__ = ['FRAME', 'decode_frames', 'spool_pcm']
+
+
+SAMPLE_RATE = 16000
+FRAME = SAMPLE_RATE // 2        # 每帧 0.5 秒
+
+
+def _ffmpeg_cmd(file: Path, fmt: str = 's16le'):
+    return [
+        'ffmpeg',
+        '-y',
+        '-i', str(file),
+        '-f', fmt,
+        '-ac', '1',
+        '-ar', '16000',
+        '-',
+    ]
+
+
+def decode_frames(file: Path, frame: int = FRAME) -> Iterator[np.ndarray]:
+    '''逐帧产出 int16 PCM，每帧 frame 个采样，最后一帧可能较短'''
+    process = subprocess.Popen(_ffmpeg_cmd(file), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        size = frame * 2
+        total = 0
+        while True:
+            data = process.stdout.read(size)
+            # 管道可能返回不足一帧的数据，读满或读到结尾为止
+            while data and len(data) < size:
+                more = process.stdout.read(size - len(data))
+                if not more:
+                    break
+                data += more
+            if len(data) < 2:
+                break
+            total += len(data)
+            yield np.frombuffer(data, dtype='<i2', count=len(data) // 2)
+        if not total:
+            raise RuntimeError("ffmpeg 转码失败或未读取到音频数据")
+    finally:
+        process.kill()
+        process.wait()
+
+
+def spool_pcm(file: Path) -> Tuple[object, np.ndarray]:
+    '''
+    把文件解码到临时文件，返回 (临时文件, 映射其内容的只读 int16 数组)
+
+    数组用完后先释放，再关闭临时文件
+    '''
+    spool = tempfile.TemporaryFile()
+    try:
+        samples = 0
+        for pcm in decode_frames(file):
+            spool.write(pcm.data)
+            samples += len(pcm)
+        spool.flush()
+        return spool, np.memmap(spool, dtype='<i2', mode='r', shape=(samples,))
+    except BaseException:
+        spool.close()
+        raise
+
+
+def _peak_rss() -> float:
+    '''本进程的峰值内存，单位 MB'''
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _read_all(file: Path):
+    # 改动前的做法：一次读完 float32 输出，再截断、转换为 int16
+    process = subprocess.Popen(_ffmpeg_cmd(file, 'f32le'), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    data = process.stdout.read()
+    process.wait()
+    audio = np.frombuffer(data, dtype='<f4')
+    audio = np.clip(audio, -1.0, 1.0)
+    return (audio * 32767).astype('<i2')
+
+
+def _measure(method: str, file: str):
+    if method == 'read_all':
+        _read_all(Path(file))
+    elif method == 'stream':
+        for _ in decode_frames(Path(file)):
+            pass
+    else:
+        spool, pcm = spool_pcm(Path(file))
+        hashlib.sha256(pcm.data)
+        del pcm
+        spool.close()
+    print(f'{_peak_rss():.1f}')
+
+
+def _benchmark():
+    import shutil
+
+    if shutil.which('ffmpeg') is None:
+        raise SystemExit('需要 ffmpeg')
+    methods = ('read_all', 'stream', 'spool')
+    print('峰值内存（MB，每项在独立进程中测量）')
+    print(f'{"时长":>8}' + ''.join(f'{name:>10}' for name in methods))
+    with tempfile.TemporaryDirectory() as folder:
+        for minutes in (1, 10, 30, 60):
+            file = Path(folder) / f'{minutes}.flac'
+            subprocess.run([
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={minutes * 60}',
+                '-ac', '2', str(file),
+            ], check=True)
+            row = f'{minutes:>5}min'
+            for method in methods:
+                output = subprocess.run(
+                    [sys.executable, '-m', 'util.client_decode', '--measure', method, str(file)],
+                    stdout=subprocess.PIPE, check=True, text=True,
+                ).stdout
+                row += f'{float(output):>10.1f}'
+            print(row)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        _measure(sys.argv[2], sys.argv[3])
+    else:
+        _benchmark()
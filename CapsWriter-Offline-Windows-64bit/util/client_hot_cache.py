@@ -0,0 +1,79 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Callable
+
+from config import ClientConfig as Config
+
+
+'''
+编译好的热词索引的磁盘缓存。
+
+中文热词启动时要逐条计算拼音、建自动机，词表大时要好几秒。
+这里把编译结果用 pickle 存到 ClientConfig.hot_cache_dir，
+键是「热词文本的哈希 + 影响编译结果的参数」，参数包括多音字、声调、索引结构版本和 pypinyin 版本。
+热词文件和参数都没变时直接载入，否则重新编译并覆盖缓存。
+
+每个热词文件只保留一份缓存，读取失败、键不符都当作没有缓存处理。
+'''
+
+
+__all__ = ['load_or_build']
+
+
+CACHE_VERSION = 1
+
+
+def _cache_path(name: str) -> Path:
+    return Path(getattr(Config, 'hot_cache_dir', 'cache')) / f'hot-{name}.pickle'
+
+
+def _key(name: str, text: str, params: str) -> str:
+    digest = hashlib.sha256(f'{CACHE_VERSION}|{name}|{params}|'.encode('utf-8'))
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _load(path: Path, key: str):
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(entry, dict) or entry.get('key') != key:
+        return None
+    return entry['data']
+
+
+def _save(path: Path, key: str, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 先写临时文件再改名，避免中途退出留下半个文件
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'key': key, 'data': data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_or_build(name: str, text: str, params: str, build: Callable[[str], Any]):
+    '''有匹配的缓存就载入，否则调用 build(text) 编译并写入缓存'''
+    if not getattr(Config, 'hot_cache', True):
+        return build(text)
+
+    path = _cache_path(name)
+    key = _key(name, text, params)
+    data = _load(path, key)
+    if data is not None:
+        return data
+
+    data = build(text)
+    try:
+        _save(path, key, data)
+    except OSError:
+        pass    # 缓存写不进去不影响使用
+    return data
@@ -2,14 +2,50 @@ from config import ClientConfig as Config
 from util import hot_sub_en
 from util import hot_sub_zh
 from util import hot_sub_rule
+from util.client_strip_punc import strip_punc
+from util.text_pipeline import HAS_ALNUM, HAS_CJK, Stage, TextPipeline
 
 
-def hot_sub(text: str) -> str:
-    # 热词替换
+def _build_pipeline(with_strip: bool) -> TextPipeline:
+    stages = []
     if Config.hot_zh:
-        text = hot_sub_zh.热词替换(text)
+        stages.append(Stage('中文热词', lambda text: hot_sub_zh.热词替换(text), requires=HAS_CJK))
     if Config.hot_en:
-        text = hot_sub_en.热词替换(text)
+        stages.append(Stage('英文热词', lambda text: hot_sub_en.热词替换(text), requires=HAS_ALNUM))
     if Config.hot_rule:
-        text = hot_sub_rule.热词替换(text)
-    return text
+        stages.append(Stage('自定义规则', lambda text: hot_sub_rule.热词替换(text)))
+    if with_strip:
+        stages.append(Stage('去末尾标点', strip_punc))
+    return TextPipeline(stages)
+
+
+# 热词替换的各步骤，热词文件更新后各模块内部的索引会替换，流水线本身不需要重建
+hot_sub_pipeline = _build_pipeline(with_strip=False)
+post_process_pipeline = _build_pipeline(with_strip=True)
+
+
+def hot_sub(text: str) -> str:
+    # 热词替换
+    return hot_sub_pipeline(text)
+
+
+def post_process(text: str) -> str:
+    # 热词替换，再去掉末尾标点，识别结果上屏、写文件前都经过这里
+    return post_process_pipeline(text)
+
+
+if __name__ == '__main__':
+    import sys
+    from pathlib import Path
+
+    # 用热词文件和一段长文本看后处理的时间花在哪一步：python -m util.client_hot_sub [文本文件]
+    hot_sub_zh.更新热词词典(Path('hot-zh.txt').read_text(encoding='utf-8'))
+    hot_sub_en.更新热词词典(Path('hot-en.txt').read_text(encoding='utf-8'))
+    hot_sub_rule.更新热词词典(Path('hot-rule.txt').read_text(encoding='utf-8'))
+    if len(sys.argv) > 1:
+        text = Path(sys.argv[1]).read_text(encoding='utf-8')
+    else:
+        text = '今天用 chat gpt 写了个 python 脚本，手机有5000毫安时的电池，艾特QQ点com。' * 50
+    for line in text.splitlines() * 20:
+        post_process(line)
+    print(post_process_pipeline.report())
@@ -1,6 +1,8 @@
 from os import getcwd, sep, path
-import time
+import threading
+from config import ClientConfig as Config
 from util.client_cosmic import console
+from util.client_hot_cache import load_or_build
 from util import hot_sub_zh
 from util import hot_sub_en
 from util import hot_sub_rule
@@ -21,8 +23,10 @@ def update_hot_zh():
     if not path_zh.exists():
         with open(path_zh, "w", encoding="utf-8") as f:
             f.write('# 在此文件放置中文热词，每行一个，开头带井号表示注释，会被省略')
+    hot_sub_zh.模糊音 = getattr(Config, '模糊音', False)
     with open(path_zh, "r", encoding="utf-8") as f:
-        num_hot_zh = hot_sub_zh.更新热词词典(f.read())
+        compiled = load_or_build('zh', f.read(), hot_sub_zh.索引参数(), hot_sub_zh.编译热词)
+    num_hot_zh = hot_sub_zh.载入热词(compiled)
     console.print(f'已载入 [green4]{num_hot_zh:5}[/] 条中文热词')
 
 
@@ -83,9 +87,16 @@ def observe_hot():
     return observer
 
 class HotHandler(FileSystemEventHandler):
-    """用于动态更新热词的处理器"""
+    """
+    用于动态更新热词的处理器
 
-    last_time = 0
+    文件变动后，等 debounce 秒内没有新的变动再重建（尾沿防抖），
+    连续多次保存只会按最后一次的内容重建，不会漏掉最后的修改。
+    重建在定时器的后台线程里进行，不阻塞 watchdog 的事件线程；
+    各热词模块先建好新的索引，再整体替换引用，识别中的句子不会看到建了一半的词典
+    """
+
+    debounce = 0.5
 
     updates = {
         path_zh: update_hot_zh,
@@ -94,26 +105,46 @@ class HotHandler(FileSystemEventHandler):
         path_kwds: update_hot_kwds,
     }
 
-    def on_modified(self, event):
-        # 事件间隔小于2秒就取消
-        if time.time() - self.last_time < 2:
-            return
+    def __init__(self):
+        super().__init__()
+        self._timers = {}
+        self._timers_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()   # 同一时间只做一次重建，后触发的等前一次做完
 
+    def _schedule(self, src_path):
         # 路径不对就取消
-        event_path = Path(event.src_path)
+        event_path = Path(src_path)
         if event_path not in self.updates:
             return
 
-        # 更新时间
-        self.last_time = time.time()
+        # 取消尚未触发的重建，重新计时
+        with self._timers_lock:
+            timer = self._timers.get(event_path)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.debounce, self._rebuild, args=(event_path,))
+            timer.daemon = True
+            self._timers[event_path] = timer
+            timer.start()
+
+    def _rebuild(self, event_path):
+        with self._rebuild_lock:
+            console.print('[green4]检测到配置文件更新，[/]', end='')
+            try:
+                self.updates[event_path]()
+                console.line()
+            except Exception as e:
+                console.print(f'更新热词失败：{e}', style='bright_red')
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path)
 
-        # 延迟0.2秒，避免编辑器还没有将热词文件更新完成导致读空
-        time.sleep(0.2)
-        console.print('[green4]检测到配置文件更新，[/]', end='')
+    def on_created(self, event):
+        if not event.is_directory:
+            self._schedule(event.src_path)
 
-        # 更新
-        try:
-            self.updates[event_path]()
-            console.line()
-        except Exception as e:
-            console.print(f'更新热词失败：{e}', style='bright_red')
+    def on_moved(self, event):
+        # 有些编辑器先写临时文件，再改名覆盖原文件
+        if not event.is_directory:
+            self._schedule(event.dest_path)
@@ -0,0 +1,185 @@
+import http.client
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from config import ClientConfig as Config
+
+
+'''
+HTTP 长连接池，供 client_backend_http 中所有请求共用。
+
+每个 (scheme, host, port) 维护一组空闲连接，请求完成且响应读完后连接归还到池中复用，
+省去每次听写的 TCP（以及 HTTPS 时的 TLS）握手。
+
+- 池大小：ClientConfig.http_pool_size，每个主机最多保留多少条空闲连接
+- 空闲回收：ClientConfig.http_pool_idle 秒未使用的连接由后台线程关闭
+- 失效重连：复用的连接若已被服务端关闭，自动换一条新连接重发一次
+'''
+
+
+__all__ = ['pool', 'HTTPConnectionPool', 'PooledResponse']
+
+
+# 复用旧连接时，这些异常说明服务端已经把连接关了，换新连接重发即可
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+Key = Tuple[str, str, int]
+Body = Union[None, bytes, Iterable[bytes]]
+
+
+class PooledResponse:
+    '''
+    包装 http.client.HTTPResponse，关闭时根据响应是否读完决定归还还是丢弃连接
+    '''
+
+    def __init__(self, pool: 'HTTPConnectionPool', key: Key,
+                 conn: http.client.HTTPConnection, resp: http.client.HTTPResponse):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self.status = resp.status
+        self.headers = resp.headers
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        return self._resp.read(amt)
+
+    def readline(self) -> bytes:
+        return self._resp.readline()
+
+    def __iter__(self):
+        while line := self._resp.readline():
+            yield line
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        # 响应体读完且服务端没要求断开，连接才可复用
+        if self._resp.isclosed() and not self._resp.will_close:
+            self._pool.release(self._key, conn)
+        else:
+            self._resp.close()
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HTTPConnectionPool:
+    def __init__(self, maxsize: int = 4, idle_timeout: float = 30.0):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[Key, deque] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def _new_conn(self, key: Key, timeout: float) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def acquire(self, key: Key, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        '''取一条连接，返回 (连接, 是否为复用的旧连接)'''
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                conn, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        return self._new_conn(key, timeout), False
+
+    def release(self, key: Key, conn: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) >= self.maxsize:
+                conn.close()
+                return
+            idle.append((conn, time.monotonic()))
+            self._start_reaper()
+
+    def _start_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name='http-pool-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1.0, self.idle_timeout / 2))
+            now = time.monotonic()
+            with self._lock:
+                for idle in self._idle.values():
+                    while idle and now - idle[0][1] >= self.idle_timeout:
+                        conn, _ = idle.popleft()
+                        conn.close()
+                if not any(self._idle.values()):
+                    self._reaper = None
+                    return
+
+    def clear(self):
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    idle.pop()[0].close()
+            self._idle.clear()
+
+    def urlopen(self, method: str, url: str, body: Body = None,
+                headers: Optional[dict] = None, timeout: float = 60) -> PooledResponse:
+        '''
+        发送请求并返回 PooledResponse，用完需 close（或用 with 语句）
+
+        body 为 bytes 时，若复用的连接已失效会自动重连重发；
+        body 为可迭代对象时边迭代边发送（headers 里没有 Content-Length 时用 chunked 编码），
+        无法重发，所以总是使用新连接。
+        '''
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        replayable = body is None or isinstance(body, (bytes, bytearray))
+        while True:
+            if replayable:
+                conn, reused = self.acquire(key, timeout)
+            else:
+                conn, reused = self._new_conn(key, timeout), False
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+            except _STALE_ERRORS:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            return PooledResponse(self, key, conn, resp)
+
+
+pool = HTTPConnectionPool(
+    maxsize=getattr(Config, 'http_pool_size', 4),
+    idle_timeout=getattr(Config, 'http_pool_idle', 30),
+)
@@ -6,9 +6,8 @@ import websockets
 from config import ClientConfig as Config
 from util.client_check_websocket import check_websocket
 from util.client_cosmic import Cosmic, console
-from util.client_hot_sub import hot_sub
+from util.client_hot_sub import post_process
 from util.client_rename_audio import rename_audio
-from util.client_strip_punc import strip_punc
 from util.client_type_result import type_result
 from util.client_write_md import write_md
 from util.status_overlay import overlay
@@ -30,8 +29,7 @@ async def recv_result():
                 overlay.show_status("\u8bc6\u522b\u4e2d...", animate=True, color="#22c55e", style="bars")
                 continue
 
-            text = hot_sub(text)
-            text = strip_punc(text)
+            text = post_process(text)
 
             await type_result(text)
             overlay.update_transcript(text)
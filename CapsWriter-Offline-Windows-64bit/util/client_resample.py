@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+
+
+'''
+流式抗混叠降采样，把麦克风的 48 kHz 音频逐块转为 16 kHz 单声道。
+
+直接 audio[::3] 抽取没有低通滤波，8 kHz 以上的能量会折叠进模型使用的频带。
+这里先用 Kaiser 窗设计的 FIR 低通，再按多相结构只计算需要保留的采样点：
+滤波器拆成 3 个相位，每个相位对输入的对应相位做一次 correlate，三者相加即为输出，
+运算量是先滤波后抽取的三分之一。
+
+多声道在同一步里按平均值混为单声道。每块音频到达时就处理，
+录音结束时只需 flush 出最后半个滤波器长度的尾巴，16 kHz 的数据随即就绪。
+
+用法：
+
+    resampler = StreamResampler()
+    for block in blocks:                 # float32，形状 (n,) 或 (n, channels)
+        out.append(resampler.process(block))
+    out.append(resampler.flush())
+
+直接运行本模块可以对比与 [::3] 抽取的精度和速度：
+
+    python -m util.client_resample
+'''
+
+
+__all__ = ['StreamResampler', 'design_lowpass']
+
+
+def design_lowpass(numtaps: int, cutoff: float, beta: float = 8.0) -> np.ndarray:
+    '''
+    Kaiser 窗 sinc 低通
+
+    cutoff: 截止频率，以采样率为 1 的归一化频率（48 kHz 下 7.5 kHz 即 0.15625）
+    '''
+    n = np.arange(numtaps) - (numtaps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(numtaps, beta)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+class StreamResampler:
+    def __init__(self, factor: int = 3, phase_taps: int = 41, cutoff: float = 7500 / 48000):
+        # 总长取 factor 的奇数倍，既能均分到各个相位，又有居中的对称点
+        if phase_taps % 2 == 0:
+            phase_taps += 1
+        self.factor = factor
+        self.numtaps = factor * phase_taps
+        self.half = self.numtaps // 2
+        taps = design_lowpass(self.numtaps, cutoff)
+        self._phases = [taps[p::factor] for p in range(factor)]
+        self._mix = {}
+        self.reset()
+
+    def reset(self):
+        # 左侧补半个滤波器长度的零，使第 n 个输出正好对应输入的第 factor*n 个采样
+        self._buf = np.zeros(self.half, dtype=np.float32)
+
+    def _to_mono(self, block: np.ndarray) -> np.ndarray:
+        if block.ndim == 1:
+            return block.astype(np.float32, copy=False)
+        channels = block.shape[1]
+        if channels == 1:
+            return block[:, 0].astype(np.float32, copy=False)
+        mix = self._mix.get(channels)
+        if mix is None:
+            mix = self._mix[channels] = np.full(channels, 1 / channels, dtype=np.float32)
+        return block @ mix
+
+    def _run(self, mono: np.ndarray) -> np.ndarray:
+        buf = np.concatenate((self._buf, mono))
+        n_out = (len(buf) - self.numtaps) // self.factor + 1
+        if n_out <= 0:
+            self._buf = buf
+            return np.zeros(0, dtype=np.float32)
+
+        phase_len = len(self._phases[0])
+        span = n_out + phase_len - 1
+        out = np.zeros(n_out, dtype=np.float32)
+        for p, h in enumerate(self._phases):
+            out += np.correlate(buf[p::self.factor][:span], h, 'valid')
+        self._buf = buf[n_out * self.factor:]
+        return out
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        '''输入一块 48 kHz 音频，返回这块能确定的 16 kHz 输出'''
+        return self._run(self._to_mono(block))
+
+    def flush(self) -> np.ndarray:
+        '''输入结束，补零推出剩余输出，并复位以便处理下一段'''
+        out = self._run(np.zeros(self.half, dtype=np.float32))
+        self.reset()
+        return out
+
+
+def _naive(block: np.ndarray) -> np.ndarray:
+    if block.ndim == 2:
+        block = block.mean(axis=1)
+    return block[::3]
+
+
+def _stream(resampler: StreamResampler, audio: np.ndarray, block: int) -> np.ndarray:
+    out = [resampler.process(audio[i:i + block]) for i in range(0, len(audio), block)]
+    out.append(resampler.flush())
+    return np.concatenate(out)
+
+
+def _benchmark():
+    rate, block = 48000, 2400
+    t = np.arange(rate * 2) / rate
+
+    def db(x):
+        return 20 * np.log10(np.sqrt(np.mean(np.square(x))) + 1e-12)
+
+    print('精度（2 秒单频正弦，幅度 0.5）')
+    print(f'{"输入频率":>10}{"[::3] 输出":>12}{"多相输出":>12}')
+    for freq in (1000, 4000, 7000, 9000, 11000, 15000):
+        tone = (0.5 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+        naive = _naive(tone)
+        poly = _stream(StreamResampler(), tone, block)
+        # 去掉首尾滤波器暂态后再统计
+        print(f'{freq:>8}Hz{db(naive[200:-200]):>10.1f}dB{db(poly[200:-200]):>10.1f}dB')
+
+    tone = (0.5 * np.sin(2 * np.pi * 1000 * t)).astype(np.float32)
+    ideal = tone[::3]
+    poly = _stream(StreamResampler(), tone, block)
+    print(f'\n1 kHz 通带误差：{db(poly[200:-200] - ideal[200:-200]) - db(ideal):.1f}dB（相对信号）')
+    print(f'输出长度：[::3] {len(ideal)}，多相 {len(poly)}')
+
+    print('\n吞吐（60 秒双声道噪声，50ms 一块）')
+    noise = np.random.default_rng(0).uniform(-0.5, 0.5, (rate * 60, 2)).astype(np.float32)
+    for name, fn in (
+        ('[::3]', lambda: [_naive(noise[i:i + block]) for i in range(0, len(noise), block)]),
+        ('多相', lambda: _stream(StreamResampler(), noise, block)),
+    ):
+        t1 = time.perf_counter()
+        fn()
+        cost = time.perf_counter() - t1
+        print(f'{name:>6}：{cost * 1000:7.1f}ms，{60 / cost:8.0f} 倍实时')
+
+
+if __name__ == '__main__':
+    _benchmark()
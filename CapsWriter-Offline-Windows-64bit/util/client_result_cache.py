@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from config import ClientConfig as Config
+
+
+'''
+文件转录结果的磁盘缓存。
+
+键是「解码后 PCM 的哈希 + 接口模式 + 后端地址 + 上传编码」，
+同一段音频、同样的模式和后端只会上传一次，之后重跑只需解码和计算哈希。
+
+每条缓存是一个 json 文件，保存后端的原始响应和从中取出的文本。
+文本是热词替换之前的，热词在每次读取后重新应用，所以改了热词文件再重跑也能生效。
+
+缓存总大小超过 ClientConfig.transcribe_cache_size（MB）时，按最近使用时间淘汰最旧的条目，
+命中时会更新文件的修改时间，作为最近使用的标记。
+'''
+
+
+__all__ = ['ResultCache', 'result_cache']
+
+
+class ResultCache:
+    def __init__(self, folder: Path, max_bytes: int):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(pcm: np.ndarray, mode: str) -> str:
+        digest = hashlib.sha256(np.ascontiguousarray(pcm).data)
+        identity = '|'.join([
+            mode,
+            getattr(Config, 'backend_url', '').strip().rstrip('/'),
+            getattr(Config, 'upload_codec', 'wav'),
+        ])
+        digest.update(identity.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / f'{key}.json'
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key: str, response: dict, text: str):
+        self.folder.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再改名，避免中途退出留下半个文件
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'response': response, 'text': text}, f, ensure_ascii=False)
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for path in self.folder.glob('*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                continue
+
+
+result_cache = ResultCache(
+    Path(getattr(Config, 'transcribe_cache_dir', 'cache')),
+    int(getattr(Config, 'transcribe_cache_size', 512) * 1024 * 1024),
+)
@@ -0,0 +1,68 @@
+from typing import List
+
+import numpy as np
+
+
+'''
+麦克风采集用的单生产者、单消费者环形缓冲。
+
+PortAudio 回调线程是唯一的生产者，直接把 indata 拷进预先分配好的数组，
+不再为每个 50ms 块创建副本和字典；asyncio 一侧是唯一的消费者，
+读到的是缓冲区上的视图，不复制数据。
+
+两侧各自只修改自己的计数：生产者推进 written，消费者推进 read，
+生产者先写数据再推进 written，所以消费者看到的 written 之前的数据一定已经写好，不需要锁。
+消费者落后超过容量时，最旧的数据会被覆盖，读取时直接跳到仍然有效的位置。
+'''
+
+
+__all__ = ['AudioRingBuffer']
+
+
+class AudioRingBuffer:
+    def __init__(self, capacity: int, channels: int):
+        self.capacity = capacity
+        self.channels = channels
+        self._buf = np.zeros((capacity, channels), dtype=np.float32)
+        self.written = 0        # 累计写入的帧数，只由生产者修改
+        self.read = 0           # 消费者读到的帧位置，只由消费者修改
+        self.notified = False   # 是否已有一条未处理的通知，用于合并通知
+        self.overruns = 0       # 消费者落后导致丢弃的次数
+
+    def write(self, block: np.ndarray) -> None:
+        '''生产者：把一块音频拷入缓冲区，不分配新数组'''
+        n = len(block)
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = block[:first]
+        if first < n:
+            self._buf[:n - first] = block[first:]
+        self.written += n
+
+    def pending(self) -> int:
+        return self.written - self.read
+
+    def views(self, start: int, end: int) -> List[np.ndarray]:
+        '''返回帧区间 [start, end) 在缓冲区上的视图，跨越末尾时分为两段'''
+        start = max(start, end - self.capacity)
+        if end <= start:
+            return []
+        a = start % self.capacity
+        b = a + (end - start)
+        if b <= self.capacity:
+            return [self._buf[a:b]]
+        return [self._buf[a:], self._buf[:b - self.capacity]]
+
+    def read_views(self) -> List[np.ndarray]:
+        '''
+        消费者：取出所有未读的数据并推进读位置
+
+        返回的视图在生产者再写满一圈之前有效，应当在当次处理完，不要长期持有
+        '''
+        end = self.written
+        if end - self.read > self.capacity:
+            self.overruns += 1
+            self.read = end - self.capacity
+        views = self.views(self.read, end)
+        self.read = end
+        return views
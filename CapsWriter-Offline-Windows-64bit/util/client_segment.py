@@ -0,0 +1,156 @@
+import re
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from util.client_decode import decode_frames
+
+
+'''
+长音视频的分段转录工具。
+
+iter_windows 边解码边切分，每次只在内存里保留一个片段，
+相邻片段重叠 overlap 秒，片段可以并发提交给后端。
+
+merge_segments 把各片段的结果拼起来并去掉重叠部分，每个接缝单独处理：
+- 相邻两段都有字级 tokens 和 timestamps 时，与 server_recognize.recognize 相同，
+  先按时间戳去掉落在重叠区前后一半的字，再比较端点处重复的字
+- 否则只在前一段的结尾恰好等于后一段的开头时去掉这部分，找不到就直接拼接，宁可重复也不丢字
+'''
+
+
+__all__ = ['Segment', 'iter_windows', 'merge_segments']
+
+
+SAMPLE_RATE = 16000
+MIN_OVERLAP = 4         # 按文本去重时，前后两段首尾至少有这么多字相同才认为是重叠
+
+_ALNUM = re.compile(r'[a-zA-Z0-9]')
+_TRAILING = ' ，。？！、,.?!'
+
+
+class Segment:
+    def __init__(self, index: int, offset: float, duration: float, is_final: bool):
+        self.index = index
+        self.offset = offset            # 片段在整个文件里的起点（秒）
+        self.duration = duration        # 片段时长（秒）
+        self.is_final = is_final
+        self.response: dict = {}
+        self.text = ''
+
+
+def _take(frames: Iterator[np.ndarray], count: int, carry: np.ndarray):
+    '''从帧迭代器里取出 count 个采样，返回 (取出的数据, 多读的余量)'''
+    parts = [carry]
+    got = len(carry)
+    while got < count:
+        frame = next(frames, None)
+        if frame is None:
+            break
+        parts.append(frame)
+        got += len(frame)
+    data = np.concatenate(parts)
+    return data[:count], data[count:]
+
+
+def iter_windows(file: Path, seg_duration: float, seg_overlap: float) -> Iterator[Tuple[Segment, np.ndarray]]:
+    '''边解码边切分，产出 (片段信息, int16 PCM)，最后一段的 is_final 为 True'''
+    step = int(seg_duration * SAMPLE_RATE)
+    size = int((seg_duration + seg_overlap) * SAMPLE_RATE)
+    frames = decode_frames(file)
+    try:
+        window, carry = _take(frames, size, np.zeros(0, dtype='<i2'))
+        index = 0
+        while True:
+            # 预读下一段的新数据，才能知道当前片段是不是最后一段
+            more, carry = _take(frames, step, carry)
+            segment = Segment(index, index * seg_duration, len(window) / SAMPLE_RATE, not more.size)
+            yield segment, window
+            if not more.size:
+                return
+            window = np.concatenate((window[step:], more))
+            index += 1
+    finally:
+        frames.close()
+
+
+def _token_times(response: dict) -> Optional[Tuple[list, list]]:
+    for obj in (response, response.get('asr_result')):
+        if not isinstance(obj, dict):
+            continue
+        tokens, timestamps = obj.get('tokens'), obj.get('timestamps')
+        if isinstance(tokens, list) and isinstance(timestamps, list) \
+                and tokens and len(tokens) == len(timestamps):
+            return tokens, timestamps
+    return None
+
+
+def _trim_by_timestamps(segment: Segment, seg_tokens: list, seg_times: list, overlap: float,
+                        head: bool, tail: bool, tokens: list) -> list:
+    '''head/tail 表示片段的开头/结尾与相邻片段按时间戳去重，tokens 是已经接好的前文'''
+
+    # 先粗去重，依据：字级时间戳
+    m = n = len(seg_times)
+    for i, timestamp in enumerate(seg_times, start=0):
+        if timestamp > overlap / 2:
+            m = i
+            break
+    for i, timestamp in enumerate(seg_times, start=1):
+        n = i
+        if timestamp > segment.duration - overlap / 2:
+            break
+    if not head:
+        m = 0
+    if not tail:
+        n = len(seg_times)
+
+    # 再细去重，依据：在端点是否有重复的字
+    if head and tokens[-2:] == seg_tokens[m:n][:2]:
+        m += 2
+    elif head and tokens[-1:] == seg_tokens[m:n][:1]:
+        m += 1
+    return seg_tokens[m:n]
+
+
+def _join_tokens(tokens: list) -> str:
+    text = ' '.join(tokens).replace('@@ ', '')
+    return re.sub('([^a-zA-Z0-9]) (?![a-zA-Z0-9])', r'\1', text)
+
+
+def _join_text(left: str, right: str, window: int) -> str:
+    '''前一段的结尾与后一段的开头完全相同（至少 MIN_OVERLAP 个字）时去掉重复，否则原样拼接'''
+    if not left or not right:
+        return left or right
+    core = left.rstrip(_TRAILING)
+    for size in range(min(len(core), len(right), window), MIN_OVERLAP - 1, -1):
+        if core[-size:] == right[:size]:
+            return core + right[size:]
+    if _ALNUM.match(left[-1]) and _ALNUM.match(right[0]):
+        return left + ' ' + right
+    return left + right
+
+
+def merge_segments(segments: List[Segment], overlap: float, use_tokens: bool = True) -> str:
+    # 没有识别出内容的片段（静音）不参与合并
+    segments = [segment for segment in sorted(segments, key=lambda x: x.index)
+                if segment.text.strip() or _token_times(segment.response)]
+    times = [_token_times(segment.response) if use_tokens else None for segment in segments]
+
+    # 逐对决定接缝的合并方式：前后两段紧挨着、且都有字级时间戳时按时间戳去重
+    by_time = [bool(times[i] and times[i + 1]) and segments[i + 1].index == segments[i].index + 1
+               for i in range(len(segments) - 1)]
+
+    # 重叠区内每秒最多按 10 个字估计，文本重复不会超过这个长度
+    window = max(int(overlap * 10), 8)
+    text, tokens = '', []
+    for i, segment in enumerate(segments):
+        head = i > 0 and by_time[i - 1]
+        tail = i < len(by_time) and by_time[i]
+        if not head:
+            text, tokens = _join_text(text, _join_tokens(tokens), window), []
+        if head or tail:
+            tokens += _trim_by_timestamps(segment, *times[i], overlap, head, tail, tokens)
+        else:
+            text = _join_text(text, segment.text.strip(), window)
+    return _join_text(text, _join_tokens(tokens), window)
@@ -1,50 +1,42 @@
 import asyncio
-import io
+import queue
 import time
 import uuid
-import wave
 from pathlib import Path
 from typing import List, Optional
 
 import numpy as np
 
 from config import ClientConfig as Config
+from util.client_audio_codec import post_with_fallback, stream_wav_header
 from util.client_backend_http import post_audio, post_audio_stream, post_optimize
 from util.client_cosmic import Cosmic, console
 from util.client_create_file import create_file
 from util.client_finish_file import finish_file
-from util.client_hot_sub import hot_sub
+from util.client_hot_sub import post_process
 from util.client_rename_audio import rename_audio
-from util.client_strip_punc import strip_punc
+from util.client_resample import StreamResampler
 from util.client_type_result import type_result
+from util.client_vad import trim_silence
 from util.client_write_file import write_file
 from util.client_write_md import write_md
 from util.status_overlay import overlay
 
 
-def _build_wav_bytes(chunks: List[np.ndarray]) -> bytes:
-    if not chunks:
-        return b""
-
-    audio = np.concatenate(chunks, axis=0)
-    if audio.ndim == 2:
-        audio = audio.mean(axis=1)
+def _to_pcm16(audio: np.ndarray) -> np.ndarray:
+    clipped = np.clip(audio, -1.0, 1.0)
+    return (clipped * 32767).astype("<i2")
 
-    if audio.size == 0:
-        return b""
 
-    downsampled = audio[::3]  # 48 kHz -> 16 kHz
-    clipped = np.clip(downsampled, -1.0, 1.0)
-    pcm = (clipped * 32767).astype("<i2")
-
-    buffer = io.BytesIO()
-    with wave.open(buffer, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(16000)
-        wf.writeframes(pcm.tobytes())
-    buffer.seek(0)
-    return buffer.read()
+def _build_pcm(chunks: List[np.ndarray]) -> np.ndarray:
+    if not chunks:
+        return np.zeros(0, dtype="<i2")
+    audio = np.concatenate(chunks, axis=0)
+    if audio.size and getattr(Config, "vad_trim", True):
+        # 裁掉首尾静音；整段没有人声时得到空数组，调用方会跳过上传
+        # 边录边传时已发出的音频无法再裁剪，这里只影响是否放弃和失败后的整段重传
+        audio = trim_silence(audio)
+    return _to_pcm16(audio)
 
 
 def _extract_text(result: dict) -> str:
@@ -84,7 +76,7 @@ def _search_text(obj: Optional[object]) -> str:
     return ""
 
 
-def _consume_stream_response(mode: str, audio_bytes: bytes, filename: str) -> dict:
+def _consume_stream_response(mode: str, audio, filename: str, mimetype: str = "audio/wav") -> dict:
     result = {
         "asr_text": "",
         "optimized_text": "",
@@ -103,7 +95,7 @@ def _consume_stream_response(mode: str, audio_bytes: bytes, filename: str) -> di
                 return value.strip()
         return ""
 
-    for event in post_audio_stream(mode, audio_bytes, filename):
+    for event in post_audio_stream(mode, audio, filename, mimetype):
         stage = (event.get("stage") or "").lower()
         if stage == "start":
             overlay.show_status("\u5904\u7406\u4e2d...", animate=True, color="#22c55e", style="bars")
@@ -146,14 +138,65 @@ def _consume_stream_response(mode: str, audio_bytes: bytes, filename: str) -> di
     return result
 
 
+class _ProgressiveUpload:
+    """
+    边录边传：录音越过阈值后立即向后端发起 chunked 请求，
+    之后每个音频块转成 16 kHz PCM 经队列交给上传线程，松开按键时只剩最后一块要发送
+    """
+
+    def __init__(self, mode: str, filename: str):
+        self.use_stream = getattr(Config, "use_stream_api", True)
+        self.chunks: queue.Queue = queue.Queue()
+        self.chunks.put(stream_wav_header())
+        target = _consume_stream_response if self.use_stream else post_audio
+        self.future = asyncio.ensure_future(
+            asyncio.to_thread(target, mode, self._iter_chunks(), filename)
+        )
+        # 中途取消时异常无人等待，在这里取走，避免 asyncio 报警告
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def _iter_chunks(self):
+        while (chunk := self.chunks.get()) is not None:
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+
+    def feed(self, data: np.ndarray) -> None:
+        self.chunks.put(_to_pcm16(data).tobytes())
+
+    async def finish(self):
+        self.chunks.put(None)
+        return await self.future
+
+    def abort(self) -> None:
+        self.chunks.put(ConnectionAbortedError("录音已取消"))
+
+
 async def send_audio():
     task_id = str(uuid.uuid4())
     time_start = 0.0
-    cache: List[np.ndarray] = []
-    recorded: List[np.ndarray] = []
+    begin_frame = 0
+    ring = None
+    recorded: List[np.ndarray] = []     # 已降采样到 16 kHz 的单声道音频
+    resampler = StreamResampler()
     duration = 0.0
     file_path: Optional[Path] = None
     file_handle = None
+    file_channels = 0
+    upload: Optional[_ProgressiveUpload] = None
+
+    def take(data: np.ndarray) -> None:
+        # data 是环形缓冲上的视图，在这里处理完，不保留引用
+        nonlocal duration
+        resampled = resampler.process(data)
+        recorded.append(resampled)
+        duration += len(data) / 48000
+        if upload is not None:
+            upload.feed(resampled)
+        if Config.save_audio and file_handle is not None:
+            if data.shape[1] != file_channels:     # 录音中途换了声道数不同的设备
+                data = np.repeat(data.mean(axis=1, keepdims=True), file_channels, axis=1)
+            write_file(file_handle, data)
 
     try:
         while task := await Cosmic.queue_in.get():
@@ -161,36 +204,52 @@ async def send_audio():
 
             if task["type"] == "begin":
                 time_start = task["time"]
+                begin_frame = task["frame"]
+                ring = Cosmic.ring
+                # 从按键前 preroll 秒开始取，找回开口时被截掉的第一个字
+                preroll = int(getattr(Config, "preroll", 0) * 48000)
+                ring.read = max(begin_frame - preroll, ring.written - ring.capacity, 0)
+                ring.notified = False   # 残留的通知可能已被跳过，重新允许录音回调通知
                 continue
 
+            if ring is not None and Cosmic.ring is not ring:
+                # 音频流重启后声道数变了，stream_open 换了新的环形缓冲，旧缓冲不会再有数据
+                console.print("[yellow]音频设备已变化，录音改从新设备继续[/]")
+                ring = Cosmic.ring
+                ring.read = max(ring.written - ring.capacity, 0)
+                begin_frame = ring.read - int(duration * 48000)
+
             if task["type"] == "data":
-                chunk = task["data"]
-                if task["time"] - time_start < Config.threshold:
-                    cache.append(chunk)
+                if ring is None:        # 上一个被取消的任务残留的通知
+                    if Cosmic.ring is not None:
+                        Cosmic.ring.notified = False
+                    continue
+                ring.notified = False
+
+                # 按帧位置判断是否达到阈值，未达到时数据留在环形缓冲里，不必另外缓存
+                if (ring.written - begin_frame) / 48000 < Config.threshold:
                     continue
 
                 if Config.save_audio and not file_path:
-                    file_path, file_handle = create_file(chunk.shape[1], time_start)
+                    file_channels = ring.channels
+                    file_path, file_handle = create_file(file_channels, time_start)
                     Cosmic.audio_files[task_id] = str(file_path)
 
-                if cache:
-                    data = np.concatenate(cache, axis=0)
-                    cache.clear()
-                else:
-                    data = chunk
+                if upload is None and getattr(Config, "progressive_upload", False):
+                    mode = getattr(Cosmic, "api_mode", getattr(Config, "api_mode", "optimize")).lower()
+                    filename = Path(file_path).name if file_path else "mic.wav"
+                    upload = _ProgressiveUpload(mode, Path(filename).with_suffix(".wav").name)
 
-                recorded.append(data.copy())
-                duration += len(data) / 48000
-
-                if Config.save_audio and file_handle is not None:
-                    write_file(file_handle, data)
+                for data in ring.read_views():
+                    take(data)
 
             elif task["type"] == "finish":
-                if cache:
-                    data = np.concatenate(cache, axis=0)
-                    recorded.append(data)
-                    duration += len(data) / 48000
-                    cache.clear()
+                if ring is not None:
+                    for data in ring.read_views():
+                        take(data)
+                recorded.append(resampler.flush())
+                if upload is not None:
+                    upload.feed(recorded[-1])
 
                 if Config.save_audio and file_handle is not None:
                     finish_file(file_handle)
@@ -198,9 +257,11 @@ async def send_audio():
                 console.print(f"\u4efb\u52a1\u6807\u8bc6\uff1a{task_id}")
                 console.print(f"    \u5f55\u97f3\u65f6\u957f\uff1a{duration:.2f}s")
 
-                wav_bytes = _build_wav_bytes(recorded)
-                if not wav_bytes:
-                    console.print("    Audio too short, skipped.")
+                pcm = _build_pcm(recorded)
+                if not pcm.size:
+                    if upload is not None:
+                        upload.abort()
+                    console.print("    Audio too short or silent, skipped.")
                     overlay.show_status("\u5f55\u97f3\u8fc7\u77ed", animate=False, color="#f97316")
                     overlay.update_transcript("")
                     overlay.hide(delay_ms=500)
@@ -212,9 +273,12 @@ async def send_audio():
                 stream_result = None
                 if getattr(Config, "use_stream_api", True):
                     try:
-                        stream_result = await asyncio.to_thread(
-                            _consume_stream_response, mode, wav_bytes, filename
-                        )
+                        if upload is not None and upload.use_stream:
+                            stream_result = await upload.finish()
+                        else:
+                            stream_result = await asyncio.to_thread(
+                                post_with_fallback, _consume_stream_response, mode, pcm, filename
+                            )
                     except Exception as exc:
                         stream_result = {"exception": exc}
 
@@ -225,7 +289,7 @@ async def send_audio():
                         or stream_result.get("asr_text")
                     )
                     if raw_text:
-                        text = strip_punc(hot_sub(raw_text))
+                        text = post_process(raw_text)
                         await type_result(text)
                         overlay.update_transcript(text)
                         overlay.show_status("\u8bc6\u522b\u5b8c\u6210", animate=False, color="#22c55e")
@@ -250,8 +314,15 @@ async def send_audio():
                         console.print(f"[yellow]\u6d41\u5f0f\u63a5\u53e3\u5f02\u5e38\uff1a{stream_result['exception']}[/]")
 
                 overlay.show_status("\u5904\u7406\u4e2d...", animate=True, color="#22c55e", style="bars")
+                response = None
+                if upload is not None and not upload.use_stream:
+                    try:
+                        response = await upload.finish()
+                    except Exception as exc:
+                        console.print(f"[yellow]\u8fb9\u5f55\u8fb9\u4f20\u5931\u8d25\uff0c\u6539\u4e3a\u6574\u6bb5\u4e0a\u4f20\uff1a{exc}[/]")
                 try:
-                    response = await asyncio.to_thread(post_audio, mode, wav_bytes, filename)
+                    if response is None:
+                        response = await asyncio.to_thread(post_with_fallback, post_audio, mode, pcm, filename)
                 except Exception as exc:
                     console.print(f"[red]\u53d1\u9001\u5230\u540e\u7aef\u5931\u8d25\uff1a{exc}[/]")
                     overlay.show_status("\u53d1\u9001\u5931\u8d25", animate=False, color="#ef4444")
@@ -305,8 +376,7 @@ async def send_audio():
                     overlay.hide(delay_ms=500)
                     break
 
-                text = hot_sub(candidate)
-                text = strip_punc(text)
+                text = post_process(candidate)
 
                 await type_result(text)
                 overlay.update_transcript(text)
@@ -329,3 +399,6 @@ async def send_audio():
         overlay.show_status("\u5904\u7406\u5931\u8d25", animate=False, color="#ef4444")
         overlay.update_transcript("")
         overlay.hide(delay_ms=500)
+    finally:
+        if upload is not None and not upload.future.done():
+            upload.abort()
@@ -51,9 +51,10 @@ def shortcut_correct(e: keyboard.KeyboardEvent) -> bool:
 def launch_task():
     global task
     start_time = time.time()
-    asyncio.run_coroutine_threadsafe(
-        Cosmic.queue_in.put({"type": "begin", "time": start_time, "data": None}),
-        Cosmic.loop,
+    # 与录音回调的数据通知走同一个 call_soon_threadsafe 通道，保证先后顺序
+    Cosmic.loop.call_soon_threadsafe(
+        Cosmic.queue_in.put_nowait,
+        {"type": "begin", "time": start_time, "frame": Cosmic.ring.written},
     )
     Cosmic.on = start_time
     status.start()
@@ -76,9 +77,9 @@ def finish_task():
     Cosmic.on = False
     status.stop()
     overlay.show_status("\u5904\u7406\u4e2d...", animate=True, color="#22c55e", style="bars")
-    asyncio.run_coroutine_threadsafe(
-        Cosmic.queue_in.put({"type": "finish", "time": time.time(), "data": None}),
-        Cosmic.loop,
+    Cosmic.loop.call_soon_threadsafe(
+        Cosmic.queue_in.put_nowait,
+        {"type": "finish", "time": time.time()},
     )
 
 
@@ -1,5 +1,6 @@
 
 from util.client_cosmic import console, Cosmic
+from util.client_ring_buffer import AudioRingBuffer
 import numpy as np 
 import sounddevice as sd
 import asyncio
@@ -9,21 +10,27 @@ from rich import inspect
 import threading
 
 
+SAMPLE_RATE = 48000
+BLOCK_SIZE = int(0.05 * SAMPLE_RATE)   # 0.05 seconds
+RING_SECONDS = 10                      # 环形缓冲容量
+NOTIFY_FRAMES = 2 * BLOCK_SIZE         # 攒够这么多未读帧才通知一次消费者
+
+# 数据通知只是提醒消费者去环形缓冲里取数据，所有通知共用这一个字典
+DATA_READY = {'type': 'data'}
+
+
 def record_callback(indata: np.ndarray, 
                     frames: int,
                     time_info,
                     status: sd.CallbackFlags) -> None:
+    # 空闲时也持续写入环形缓冲，按下快捷键时可以取回按键之前的一小段作为预录音
+    ring = Cosmic.ring
+    ring.write(indata)
     if not Cosmic.on:
         return
-    asyncio.run_coroutine_threadsafe(
-        Cosmic.queue_in.put(
-            {'type': 'data',
-             'time': time.time(),
-             'data': indata.copy(),
-             },
-        ),
-        Cosmic.loop
-    )
+    if not ring.notified and ring.pending() >= NOTIFY_FRAMES:
+        ring.notified = True
+        Cosmic.loop.call_soon_threadsafe(Cosmic.queue_in.put_nowait, DATA_READY)
 
 
 def stream_close(signum, frame):
@@ -61,9 +68,13 @@ def stream_open():
         console.print("没有找到麦克风设备", end='\n\n', style='bright_red')
         input('按回车键退出'); sys.exit()
 
+    # 重启音频流时沿用原来的环形缓冲，正在录音的任务继续从里面取数据；声道数变了才换新的
+    if Cosmic.ring is None or Cosmic.ring.channels != channels:
+        Cosmic.ring = AudioRingBuffer(RING_SECONDS * SAMPLE_RATE, channels)
+
     stream = sd.InputStream(
-        samplerate=48000,
-        blocksize=int(0.05 * 48000),  # 0.05 seconds
+        samplerate=SAMPLE_RATE,
+        blocksize=BLOCK_SIZE,
         device=None,
         dtype="float32",
         channels=channels,
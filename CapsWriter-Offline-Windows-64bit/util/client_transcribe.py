@@ -1,18 +1,19 @@
 import asyncio
-import io
 import json
-import subprocess
-import wave
+import time
 from pathlib import Path
 from typing import Dict
 
 import numpy as np
 
 from config import ClientConfig as Config
+from util.client_audio_codec import post_with_fallback
 from util.client_backend_http import post_audio, post_optimize
 from util.client_cosmic import console, Cosmic
-from util.client_hot_sub import hot_sub
-from util.client_strip_punc import strip_punc
+from util.client_decode import spool_pcm
+from util.client_hot_sub import post_process
+from util.client_result_cache import result_cache
+from util.client_segment import Segment, iter_windows, merge_segments
 
 
 SUPPORTED_MEDIA = {'.wav', '.mp3', '.m4a', '.flac', '.aac', '.mp4', '.mov', '.avi', '.mkv'}
@@ -22,6 +23,10 @@ def is_supported_media(path: Path) -> bool:
     return path.suffix.lower() in SUPPORTED_MEDIA
 
 
+def _is_subtitle(path: Path) -> bool:
+    return path.suffix.lower() in {'.txt', '.json', '.srt'}
+
+
 def _search_text(obj) -> str:
     if isinstance(obj, str):
         return obj.strip()
@@ -42,36 +47,6 @@ def _search_text(obj) -> str:
     return ''
 
 
-def _convert_to_wav_bytes(file: Path) -> bytes:
-    ffmpeg_cmd = [
-        'ffmpeg',
-        '-y',
-        '-i', str(file),
-        '-f', 'f32le',
-        '-ac', '1',
-        '-ar', '16000',
-        '-',
-    ]
-    process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-    data = process.stdout.read()
-    process.wait()
-    if not data:
-        raise RuntimeError("ffmpeg 转码失败或未读取到音频数据")
-
-    audio = np.frombuffer(data, dtype='<f4')
-    audio = np.clip(audio, -1.0, 1.0)
-    int16 = (audio * 32767).astype('<i2')
-
-    buffer = io.BytesIO()
-    with wave.open(buffer, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(16000)
-        wf.writeframes(int16.tobytes())
-    buffer.seek(0)
-    return buffer.read()
-
-
 def _pick_text(result: Dict, mode: str) -> str:
     preferred_keys = {
         'transcribe': ['recognized_text', 'text', 'optimized_text'],
@@ -91,25 +66,11 @@ def _pick_text(result: Dict, mode: str) -> str:
     return ''
 
 
-async def _transcribe_single(file: Path, adjust_srt):
-    console.print(f'\n处理文件：{file}')
-    if file.suffix.lower() in {'.txt', '.json', '.srt'}:
-        adjust_srt(file)
-        return
-
-    if not is_supported_media(file):
-        console.print(f'[red]暂不支持的文件类型：{file.suffix}[/]')
-        return
-
-    wav_bytes = await asyncio.to_thread(_convert_to_wav_bytes, file)
-    mode = getattr(Cosmic, 'api_mode', getattr(Config, 'api_mode', 'optimize')).lower()
-    try:
-        response = await asyncio.to_thread(post_audio, mode, wav_bytes, file.name)
-    except Exception as e:
-        console.print(f'[red]上传失败：{e}[/]')
-        return
-
-    console.print(f'    后端响应: {response}')
+async def _request_text(file: Path, pcm: np.ndarray, mode: str, log, verbose: bool = True):
+    '''上传音频，返回后端原始响应和从中取出的文本（未做热词替换）'''
+    response = await asyncio.to_thread(post_with_fallback, post_audio, mode, pcm, file.name)
+    if verbose:
+        log(f'    后端响应: {response}')
 
     text = _pick_text(response, mode)
     if not text and mode == 'transcribe':
@@ -118,15 +79,18 @@ async def _transcribe_single(file: Path, adjust_srt):
             opt_resp = await asyncio.to_thread(post_optimize, response.get('text', ''), optimize_mode)
             text = _pick_text(opt_resp, 'optimize') or _search_text(opt_resp)
         except Exception as e:
-            console.print(f'[yellow]文本优化失败：{e}[/]')
+            log(f'[yellow]文本优化失败：{e}[/]')
 
     if not text:
         text = _search_text(response)
+    return response, text
+
 
-    text = hot_sub(strip_punc(text)) if text else ''
+def _write_result(file: Path, text: str, response: dict, log):
+    text = post_process(text) if text else ''
     skip_markers = {'', 'none', '无修改', '未修改', '暂无内容', 'no change'}
     if not text or text.strip().lower() in skip_markers:
-        console.print('[yellow]后端未返回文本结果[/]')
+        log('[yellow]后端未返回文本结果[/]')
         return
 
     txt_filename = file.with_suffix('.txt')
@@ -140,9 +104,191 @@ async def _transcribe_single(file: Path, adjust_srt):
     with open(json_filename, 'w', encoding='utf-8') as f:
         json.dump({'text': text, 'raw_response': response}, f, ensure_ascii=False, indent=2)
 
-    console.print(f'    识别结果已写入：{txt_filename}')
+    log(f'    识别结果已写入：{txt_filename}')
+
+
+class _Batch:
+    '''
+    批量转录的流水线：解码、上传、后处理三个阶段各自限制并发，
+    不同文件的阶段可以重叠，比如一个文件在上传时，下一个文件已经在解码。
+    解码由 ffmpeg 子进程完成，这边只是流式读取管道，放在线程里即可
+    '''
+
+    def __init__(self, total: int):
+        decode_workers = max(1, getattr(Config, 'file_decode_workers', 2))
+        upload_workers = max(1, getattr(Config, 'file_upload_workers', 2))
+        self.decode = asyncio.Semaphore(decode_workers)
+        self.upload = asyncio.Semaphore(upload_workers)
+        self.post = asyncio.Semaphore(max(1, getattr(Config, 'file_post_workers', 2)))
+        # 已解码未上传的文件数上限，避免解码跑得太快把临时文件堆在磁盘上
+        self.decoded = asyncio.Semaphore(decode_workers + upload_workers)
+
+        self.total = total
+        self.done = 0
+        self.seconds = 0.0
+        self.time_start = time.time()
+
+    def finish_one(self, seconds: float):
+        self.done += 1
+        self.seconds += seconds
+        elapsed = time.time() - self.time_start
+        eta = elapsed / self.done * (self.total - self.done)
+        speed = self.seconds / elapsed if elapsed else 0
+        console.print(
+            f'    进度：{self.done}/{self.total}，已转录音频 {self.seconds:.0f}s，'
+            f'速度 {speed:.1f} 倍实时，剩余约 {eta:.0f}s',
+            end='\r',
+        )
+
+
+async def _transcribe_single(file: Path, batch: _Batch):
+    '''转录一个文件，返回 (音频时长, 输出)，输出先攒在列表里，由调用方按文件顺序打印并更新进度'''
+    lines = [f'\n处理文件：{file}']
+    log = lines.append
+    seconds = 0.0
+    try:
+        if not is_supported_media(file):
+            log(f'[red]暂不支持的文件类型：{file.suffix}[/]')
+            return seconds, lines
+
+        mode = getattr(Cosmic, 'api_mode', getattr(Config, 'api_mode', 'optimize')).lower()
+        # 只有纯转录才分段：optimize、translate 会让大模型改写文本，各段改写后无法可靠地去重拼接
+        if getattr(Config, 'file_segment', True) and mode == 'transcribe':
+            try:
+                async with batch.decoded:
+                    seconds, text, response = await _transcribe_segmented(file, mode, batch, log)
+            except Exception as e:
+                log(f'[red]上传失败：{e}[/]')
+                return seconds, lines
+            async with batch.post:
+                await asyncio.to_thread(_write_result, file, text, response, log)
+            return seconds, lines
+
+        use_cache = getattr(Config, 'transcribe_cache', True)
+
+        async with batch.decoded:
+            # 解码到磁盘临时文件，哈希和上传都按块读取，不把整个文件读进内存
+            async with batch.decode:
+                spool, pcm = await asyncio.to_thread(spool_pcm, file)
+            seconds = len(pcm) / 16000
+            try:
+                key = await asyncio.to_thread(result_cache.key, pcm, mode) if use_cache else None
+                cached = result_cache.get(key) if use_cache else None
+                if cached:
+                    log('    命中转录缓存，跳过上传')
+                    response, text = cached['response'], cached['text']
+                else:
+                    try:
+                        async with batch.upload:
+                            response, text = await _request_text(file, pcm, mode, log)
+                    except Exception as e:
+                        log(f'[red]上传失败：{e}[/]')
+                        return seconds, lines
+                    if use_cache and text:
+                        await asyncio.to_thread(result_cache.put, key, response, text)
+            finally:
+                del pcm
+                spool.close()
+
+        async with batch.post:
+            await asyncio.to_thread(_write_result, file, text, response, log)
+        return seconds, lines
+    except Exception as e:
+        log(f'[red]处理失败：{e}[/]')
+        return seconds, lines
+
+
+async def _transcribe_segment(file: Path, segment: Segment, pcm: np.ndarray,
+                              mode: str, batch: _Batch, log) -> bool:
+    '''转录一个片段，结果记在 segment 上，返回是否命中缓存'''
+    use_cache = getattr(Config, 'transcribe_cache', True)
+    key = await asyncio.to_thread(result_cache.key, pcm, mode) if use_cache else None
+    cached = result_cache.get(key) if use_cache else None
+    if cached:
+        segment.response, segment.text = cached['response'], cached['text']
+        return True
+
+    async with batch.upload:
+        segment.response, segment.text = await _request_text(file, pcm, mode, log, verbose=False)
+    if use_cache and segment.text:
+        await asyncio.to_thread(result_cache.put, key, segment.response, segment.text)
+    return False
+
+
+async def _transcribe_segmented(file: Path, mode: str, batch: _Batch, log):
+    '''
+    边解码边分段上传，各片段并发请求后端，全部完成后去重合并
+
+    同一文件里已读出、未完成的片段数有上限，解码跑在上传前面时会在这里等待，
+    所以内存里最多只有这么多个片段，与文件长短无关
+    '''
+    seg_duration = getattr(Config, 'file_seg_duration', 25)
+    seg_overlap = getattr(Config, 'file_seg_overlap', 2)
+    slots = asyncio.Semaphore(max(1, getattr(Config, 'file_upload_workers', 2)) + 1)
+
+    async def run(segment, pcm):
+        try:
+            return await _transcribe_segment(file, segment, pcm, mode, batch, log)
+        finally:
+            slots.release()
+
+    windows = iter_windows(file, seg_duration, seg_overlap)
+    segments, tasks = [], []
+    try:
+        # 解码期间占用一个解码名额，同时运行的 ffmpeg 不超过 file_decode_workers 个
+        async with batch.decode:
+            while True:
+                await slots.acquire()
+                item = await asyncio.to_thread(next, windows, None)
+                if item is None:
+                    slots.release()
+                    break
+                segment, pcm = item
+                segments.append(segment)
+                tasks.append(asyncio.create_task(run(segment, pcm)))
+                del item, pcm
+        hits = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        try:
+            windows.close()
+        except ValueError:
+            pass    # 被取消时解码线程可能还在读，由它读完后自行回收
+
+    seconds = segments[-1].offset + segments[-1].duration
+    if all(hits):
+        log('    命中转录缓存，跳过上传')
+    elif len(segments) > 1:
+        log(f'    共 {len(segments)} 段，其中 {sum(hits)} 段命中缓存')
+
+    # 纯转录的文本与字级时间戳对应，可以按时间戳去重
+    text = merge_segments(segments, seg_overlap)
+    response = {'segments': [
+        {'offset': segment.offset, 'duration': segment.duration, 'response': segment.response}
+        for segment in segments
+    ]}
+    return seconds, text, response
 
 
 async def transcribe_files(files, adjust_srt):
-    for file in files:
-        await _transcribe_single(Path(file), adjust_srt)
+    files = [Path(file) for file in files]
+    batch = _Batch(len(files))
+    tasks = [
+        None if _is_subtitle(file) else asyncio.create_task(_transcribe_single(file, batch))
+        for file in files
+    ]
+    # 各文件并发处理，但输出按拖入的顺序打印
+    for file, task in zip(files, tasks):
+        if task is None:
+            console.print(f'\n处理文件：{file}')
+            adjust_srt(file)
+            batch.finish_one(0)
+            continue
+        seconds, lines = await task
+        for line in lines:
+            console.print(line)
+        batch.finish_one(seconds)
@@ -0,0 +1,97 @@
+import numpy as np
+
+from config import ClientConfig as Config
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+
+'''
+上传前的语音活动检测，输入输出都是 16 kHz 单声道 float32。
+
+按 30ms 一帧判断是否有人声：
+- 默认用能量和过零率：能量高于底噪一定幅度的帧算人声，
+  能量稍低但过零率高的帧（s、x、f 等清擦音）也算人声
+- 安装了 webrtcvad 且 ClientConfig.vad_webrtc 为 True 时，改用 WebRTC 的模型判断
+
+trim_silence 裁掉首尾静音（两端各留 vad_pad 秒余量），
+vad_max_pause 大于 0 时还会把中间过长的停顿压缩到这个长度。
+整段都没有人声时返回空数组，调用方据此跳过上传。
+'''
+
+
+__all__ = ['speech_mask', 'trim_silence']
+
+
+SAMPLE_RATE = 16000
+FRAME = 480             # 30ms
+MIN_SPEECH = 5          # 至少这么多帧人声，才不算纯静音
+HANGOVER = 3            # 人声帧前后各延长的帧数，避免切掉字头字尾
+
+
+def _energy_mask(frames: np.ndarray) -> np.ndarray:
+    energy = 10 * np.log10(np.mean(np.square(frames), axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / FRAME
+
+    # 底噪取能量较低的一成帧，门限在底噪之上，但不高于 -35dB、不低于 -55dB
+    floor = np.percentile(energy, 10)
+    threshold = min(max(floor + 12, -55), -35)
+    return (energy > threshold) | ((energy > threshold - 6) & (zcr > 0.25))
+
+
+def _webrtc_mask(frames: np.ndarray) -> np.ndarray:
+    vad = webrtcvad.Vad(getattr(Config, 'vad_aggressiveness', 2))
+    pcm = (np.clip(frames, -1.0, 1.0) * 32767).astype('<i2')
+    return np.array([vad.is_speech(frame.tobytes(), SAMPLE_RATE) for frame in pcm])
+
+
+def speech_mask(audio: np.ndarray) -> np.ndarray:
+    '''返回每一帧是否为人声的布尔数组，不足一帧的尾巴按最后一帧处理'''
+    n = len(audio) // FRAME
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[:n * FRAME].reshape(n, FRAME)
+    if webrtcvad is not None and getattr(Config, 'vad_webrtc', True):
+        mask = _webrtc_mask(frames)
+    else:
+        mask = _energy_mask(frames)
+
+    # 向前后各延长几帧
+    padded = np.concatenate((np.zeros(HANGOVER, bool), mask, np.zeros(HANGOVER, bool)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * HANGOVER + 1)
+    return windows.any(axis=1)
+
+
+def trim_silence(audio: np.ndarray) -> np.ndarray:
+    mask = speech_mask(audio)
+    if np.count_nonzero(mask) < MIN_SPEECH:
+        return audio[:0]
+
+    pad = int(getattr(Config, 'vad_pad', 0.2) * SAMPLE_RATE)
+    speech = np.flatnonzero(mask)
+    start = max(speech[0] * FRAME - pad, 0)
+    end = min((speech[-1] + 1) * FRAME + pad, len(audio))
+    if speech[-1] == len(mask) - 1:
+        end = len(audio)
+
+    max_pause = getattr(Config, 'vad_max_pause', 0)
+    if max_pause <= 0:
+        return audio[start:end]
+
+    # 压缩中间的长停顿：停顿两端各留一半 max_pause
+    keep = int(max_pause * SAMPLE_RATE) // 2
+    segments = []
+    cursor = start
+    gaps = np.flatnonzero(np.diff(speech) > 1)
+    for i in gaps:
+        gap_start = (speech[i] + 1) * FRAME
+        gap_end = speech[i + 1] * FRAME
+        if gap_end - gap_start <= 2 * keep:
+            continue
+        segments.append(audio[cursor:gap_start + keep])
+        cursor = gap_end - keep
+    segments.append(audio[cursor:end])
+    return np.concatenate(segments)
@@ -5,12 +5,15 @@ kwd_list = []
 def do_updata_kwd(kwd_text: str):
     '''
     把关键词文本中的每一行去除多余空格后添加到列表，
+
+    先建好新列表，再用切片赋值一次性替换内容，
+    其他模块 import 的是同一个列表对象，读取时不会看到清空了一半的列表
     '''
-    kwd_list.clear()
-    kwd_list.append('')
+    new_list = ['']
 
     # 如果不启用关键词功能，直接返回
     if not Config.hot_kwd:
+        kwd_list[:] = new_list
         return len(kwd_list)
 
     # 更新关键词
@@ -18,6 +21,7 @@ def do_updata_kwd(kwd_text: str):
         kwd = kwd.strip()
         if not kwd or kwd.startswith('#'):
             continue
-        kwd_list.append(kwd)
+        new_list.append(kwd)
 
-    return len(kwd_list)
+    kwd_list[:] = new_list
+    return len(new_list)
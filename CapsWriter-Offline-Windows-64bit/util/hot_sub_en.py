@@ -18,13 +18,46 @@ res = 热词替换('the chat gpt is now fully supported by microsoft')
 
 print(res)
 
+
+更新热词词典时，把所有热词编译成一个正则表达式，替换时对句子只扫描一遍：
+
+- 不区分大小写，热词的字母之间可以有任意个空格，热词里的符号会被忽略，
+  例如「7-Zip」可以匹配「7 zip」，「ChatGPT」可以匹配「chat gpt」
+- 热词前后不能紧挨着英文字母，「AI」不会匹配「said」里的「ai」
+- 同一位置有多个热词能匹配时，最长的优先，「Apple Watch」优先于「Apple」
+- 去掉符号、转为小写后相同的热词，以后出现的为准
+
+正则表达式按热词的字母前缀合并成树状，公共前缀只比较一次，
+例如 Apple、Apple Watch、Apple Vision 合并为 apple(?: *(?:vision|watch))?
 '''
 
 
 
 __all__ = ['更新热词词典', '热词替换']
 
-热词词典 = {}       
+热词词典 = {}
+_编译结果 = (None, {})  # (全部热词合并成的正则, 去掉符号的小写 → 热词)，更新时整体替换
+
+
+def _子模式(节点: dict) -> str:
+    '''把前缀树的一个节点转为正则，'' 键表示有热词在此结束'''
+    分支 = [re.escape(字) + _子模式(子节点) for 字, 子节点 in sorted(节点.items()) if 字]
+    if not 分支:
+        return ''
+    模式 = ' *' + (分支[0] if len(分支) == 1 else '(?:' + '|'.join(分支) + ')')
+    # 能在此结束时，后续部分可选；贪婪匹配会先尝试更长的热词
+    return f'(?:{模式})?' if '' in 节点 else 模式
+
+
+def _编译(规范写法: dict):
+    前缀树 = {}
+    for 键 in 规范写法:
+        节点 = 前缀树
+        for 字 in 键:
+            节点 = 节点.setdefault(字, {})
+        节点[''] = {}
+    分支 = [re.escape(字) + _子模式(子节点) for 字, 子节点 in sorted(前缀树.items())]
+    return re.compile(r'(?<![a-zA-Z])(?:' + '|'.join(分支) + r')(?![a-zA-Z])', flags=re.I)
 
 
 def 更新热词词典(热词文本: str):
@@ -33,42 +66,44 @@ def 更新热词词典(热词文本: str):
     key 是热词，
     value 是热词的小写
     '''
-    global 热词词典; 热词词典.clear()
+    global 热词词典, _编译结果
+    新词典 = {}
     for 热词 in 热词文本.splitlines():
         热词 = 热词.strip()
         if not 热词 or 热词.startswith('#'): continue
-        热词词典[热词] = re.sub('[^\w]', '', 热词.lower())
-    return len(热词词典)
+        新词典[热词] = re.sub(r'[^\w]', '', 热词.lower())
+
+    规范写法 = {值: 词 for 词, 值 in 新词典.items() if 值}
+    热词词典, _编译结果 = 新词典, (_编译(规范写法) if 规范写法 else None, 规范写法)
+    return len(新词典)
 
 
 def 匹配热词(句子:str):
     '''
-    将全局「热词词典」中的热词按照小写依次与句子匹配，将所有匹配到的热词放到列表
+    用编译好的正则扫描句子，将所有匹配到的热词放到列表
     '''
-    global 热词词典
-
+    模式, 规范写法 = _编译结果
+    if 模式 is None:
+        return []
     所有匹配 = []
-    小写无空格句子 = 句子.lower().replace(' ', '')
-    for 词 in 热词词典:
-        if 热词词典[词] in 小写无空格句子:
+    for 匹配 in 模式.finditer(句子):
+        词 = 规范写法[匹配.group().replace(' ', '').lower()]
+        if 词 not in 所有匹配:
             所有匹配.append(词)
-    
     return 所有匹配
 
+
 def 热词替换(句子):
     '''
     从热词词典中查找匹配的热词，替换句子
 
     句子：       被查找和替换的句子
     '''
-    所有匹配 = 匹配热词(句子)
-    for 匹配项 in 所有匹配:
-        正则模式 = re.sub('[^\w]', '', 匹配项)
-        正则模式1 = r'(?<=[^a-zA-z])' + re.sub('(.)', r'\1 *?', 正则模式) + r'(?=[^a-zA-z]|\b)'
-        正则模式2 = r'(?<=\b)' + re.sub('(.)', r'\1 *?', 正则模式) + r'(?=[^a-zA-z]|\b)'
-        句子 = re.sub(正则模式1, 匹配项, 句子, flags=re.I)
-        句子 = re.sub(正则模式2, 匹配项, 句子, flags=re.I)
-    return 句子
+    模式, 规范写法 = _编译结果
+    if 模式 is None:
+        return 句子
+    return 模式.sub(lambda 匹配: 规范写法[匹配.group().replace(' ', '').lower()], 句子)
+
 
 if __name__ == '__main__':
     print(f'\x9b42m-------------开始---------------\x9b0m')
@@ -78,17 +113,35 @@ if __name__ == '__main__':
         Microsoft
         CD-ROM
         iPhone4S
+        iPhone
         7-Zip
         AI
         CapsWriter
         GB
         IP
+        Apple
+        Apple Watch
+        Pro
     '''
 
     更新热词词典(热词文本)
 
     res = 热词替换('7 zip测试')
-
-
     print(f'{res}')
 
+    测试 = [
+        ('7 zip测试', '7-Zip测试'),
+        ('the chat gpt is now fully supported by microsoft', 'the ChatGPT is now fully supported by Microsoft'),
+        ('我买了apple watch和apple', '我买了Apple Watch和Apple'),      # 最长优先
+        ('iphone 4s 和 iphone', 'iPhone4S 和 iPhone'),
+        ('said ai is', 'said AI is'),                                # 前后紧挨字母的不替换
+        ('cd rom里有8gb文件', 'CD-ROM里有8GB文件'),
+        ('ip地址', 'IP地址'),
+        ('apple pro', 'Apple Pro'),
+        ('applepro', 'applepro'),                                    # 没有对应热词的连写不替换
+        ('', ''),
+    ]
+    for 输入, 期望 in 测试:
+        输出 = 热词替换(输入)
+        assert 输出 == 期望, f'{输入!r} → {输出!r}，期望 {期望!r}'
+    print(f'{len(测试)} 条用例通过')
@@ -28,7 +28,69 @@ import re
 
 __all__ = ['更新热词词典', '热词替换']
 
-模式词典 = {}       
+模式词典 = {}
+_替换步骤 = []      # 编译好的替换步骤，按规则顺序依次执行
+
+
+class 字面组:
+    '''
+    连续的若干条纯文本规则，合并成一个正则，一遍替换
+
+    只有彼此互不影响的规则才会合并：任意两条的查找词互不包含、首尾不相接，
+    且后面规则的查找词与前面规则的替换词也没有重叠，前面也没有替换为空的删除规则，
+    这样一遍替换与逐条替换的结果相同
+    '''
+
+    def __init__(self):
+        self.词典 = {}
+        self.模式 = None
+
+    def 可加入(self, key: str) -> bool:
+        # 删除规则会让两侧的文本接上，拼出后面规则的查找词，组里有删除规则就不再加入
+        if '' in self.词典.values(): return False
+        return not any(_相交(key, 旧) or _相交(key, 值) for 旧, 值 in self.词典.items())
+
+    def 加入(self, key: str, value: str):
+        self.词典[key] = value
+
+    def 编译(self):
+        self.模式 = re.compile('|'.join(map(re.escape, self.词典)))
+
+    def 替换(self, 句子: str) -> str:
+        return self.模式.sub(lambda 匹配: self.词典[匹配.group()], 句子)
+
+
+class 正则规则:
+    def __init__(self, 模式: re.Pattern, value: str):
+        self.模式 = 模式
+        self.value = value
+
+    def 替换(self, 句子: str) -> str:
+        return self.模式.sub(self.value, 句子)
+
+
+def _相交(a: str, b: str) -> bool:
+    '''两段文本是否有重叠：一个包含另一个，或者一个的结尾是另一个的开头'''
+    if not a or not b: return False
+    if a in b or b in a: return True
+    for n in range(1, min(len(a), len(b))):
+        if a.endswith(b[:n]) or b.endswith(a[:n]):
+            return True
+    return False
+
+
+def _是字面(key: str, value: str) -> bool:
+    return re.escape(key) == key and '\\' not in value
+
+
+def _检查引用(模式: re.Pattern, value: str):
+    '''替换式里引用的分组必须存在，否则要到替换时才会报错'''
+    for 编号 in re.findall(r'\\(\d+)', value):
+        if int(编号) > 模式.groups:
+            raise re.error(f'替换式引用了不存在的分组 \\{编号}')
+    for 名称 in re.findall(r'\\g<([^>]*)>', value):
+        if not (名称.isdigit() and int(名称) <= 模式.groups) and 名称 not in 模式.groupindex:
+            raise re.error(f'替换式引用了不存在的分组 \\g<{名称}>')
 
 
 def 更新热词词典(热词文本: str):
@@ -36,29 +98,55 @@ def 更新热词词典(热词文本: str):
     把热词规则文本中的每一行用 = 分开，去除多余空格后添加到热词词典，
     key     是被替换的词，
     value   是将被替换成的词
+
+    每条规则在载入时编译，格式不对或正则有误的规则会打印出行号并跳过；
+    连续的纯文本规则在不影响结果的前提下合并成一步
     '''
-    global 模式词典; 模式词典.clear()
-    for 热词 in 热词文本.splitlines():
-        if not 热词 or 热词.startswith('#'): continue
+    global 模式词典, _替换步骤
+    新词典 = {}
+    for 行号, 热词 in enumerate(热词文本.splitlines(), start=1):
+        if not 热词.strip() or 热词.strip().startswith('#'): continue
         key_value = 热词.split(' = ')
-        if len(key_value) == 2:
-            key = key_value[0].strip()
-            value = key_value[1].strip()
-            模式词典[key] = value
-    return len(模式词典)
+        if len(key_value) != 2:
+            print(f'\x9b31m    第 {行号} 行规则「{热词.strip()}」格式不对，应为「查找模式 = 替换式」，已跳过\x9b0m')
+            continue
+        key = key_value[0].strip()
+        value = key_value[1].strip()
+        try:
+            if not key: raise re.error('查找模式为空')
+            _检查引用(re.compile(key), value)
+        except re.error as e:
+            print(f'\x9b31m    第 {行号} 行规则「{热词.strip()}」有误：{e}，已跳过\x9b0m')
+            continue
+        新词典[key] = value
+
+    # 按顺序生成替换步骤，连续且互不影响的纯文本规则合并
+    步骤 = []
+    for key, value in 新词典.items():
+        if not _是字面(key, value):
+            步骤.append(正则规则(re.compile(key), value))
+            continue
+        if not 步骤 or not isinstance(步骤[-1], 字面组) or not 步骤[-1].可加入(key):
+            步骤.append(字面组())
+        步骤[-1].加入(key, value)
+    for 一步 in 步骤:
+        if isinstance(一步, 字面组): 一步.编译()
+
+    # 整体替换引用，进行中的替换继续使用旧的步骤列表
+    模式词典, _替换步骤 = 新词典, 步骤
+    return len(新词典)
 
 
 def 匹配热词(句子:str):
     '''
     将全局「热词词典」中的热词按照 key 依次与句子匹配，将所有匹配到的热词放到列表
     '''
-    global 模式词典
-
     所有匹配 = []
-    for 模式 in 模式词典:
-        if re.findall(模式, 句子):
-            所有匹配.append(模式)
-    
+    for 一步 in _替换步骤:
+        if isinstance(一步, 字面组):
+            所有匹配.extend(dict.fromkeys(匹配.group() for 匹配 in 一步.模式.finditer(句子)))
+        elif 一步.模式.search(句子):
+            所有匹配.append(一步.模式.pattern)
     return 所有匹配
 
 def 热词替换(句子:str):
@@ -67,9 +155,8 @@ def 热词替换(句子:str):
 
     句子：       被查找和替换的句子
     '''
-    所有匹配模式 = 匹配热词(句子)
-    for 模式 in 所有匹配模式:
-        句子 = re.sub(模式, 模式词典[模式], 句子)
+    for 一步 in _替换步骤:
+        句子 = 一步.替换(句子)
     return 句子
 
 if __name__ == '__main__':
@@ -88,3 +175,32 @@ if __name__ == '__main__':
 
     print(f'{res}')
 
+    # 合并后的结果应与逐条 re.sub 相同
+    热词文本 = r'''
+        毫安时     =      mAh
+        赫兹      =      Hz
+        伏特      =        V
+        二、      =        二
+        负一      =    -1
+        一个      =    1个
+        -1个     =    负一个
+        (艾特)\s*(QQ)\s*点\s*            =     @qq.
+        (艾特)\s*([一幺]六三)\s*点\s*     =     @163.
+        (艾特)\s*(\w+)\s*(点)\s*(\w+)    =     @\2.\4
+        没有等号的行
+        (未闭合     =     x
+        (a)b      =     \2
+    '''
+    数量 = 更新热词词典(热词文本)
+    print(f'载入 {数量} 条规则，分为 {len(_替换步骤)} 步')
+    for 句子 in ['5000毫安时，220伏特，50赫兹', '负一个二、三', '邮箱是艾特QQ点com', '艾特 gmail 点 com']:
+        逐条 = 句子
+        for 模式, 值 in 模式词典.items():
+            逐条 = re.sub(模式, 值, 逐条)
+        assert 热词替换(句子) == 逐条, (句子, 热词替换(句子), 逐条)
+        print(f'{句子} → {热词替换(句子)}')
+
+    # 删除规则之后的规则不能合并：删掉「嗯」后「你」「好」接上，应被后面的规则替换
+    更新热词词典('嗯 = \n你好 = 您好')
+    assert 热词替换('你嗯好') == '您好', 热词替换('你嗯好')
+    print(f'你嗯好 → {热词替换("你嗯好")}')
@@ -1,6 +1,10 @@
-from pypinyin import pinyin
+from functools import lru_cache
+from itertools import product
+from pypinyin import pinyin, __version__ as pypinyin_version
 from time import time
 
+from util.hot_sub_zh_fuzzy import 模糊索引
+
 '''
 热词是每行一个的文本，先更新热词词典，然后再替换句子中的热词。
 使用方法示例：
@@ -24,7 +28,7 @@ print(res)
 
 
 
-__all__ = ['更新热词词典', '热词替换', '多音字', '声调']
+__all__ = ['更新热词词典', '热词替换', '多音字', '声调', '模糊音']
 
 
 # ================全局配置=======================
@@ -33,12 +37,30 @@ __all__ = ['更新热词词典', '热词替换', '多音字', '声调']
 热词词典 = {}
 多音字 = True
 声调 = False     # 是否要求匹配声调
+模糊音 = False   # 是否容忍平翘舌、前后鼻音、n/l 等近音错误，见 hot_sub_zh_fuzzy
+展开长度 = 2     # 多音字只在热词的前几个字展开读音组合，后面的字按音节格逐字校验
+拼音缓存大小 = 8192     # 单字读音缓存的条数上限
 
 
 # ===========================================
 
 
 风格 = 1 if 声调 else 0     # 依据是否需要声调，设置拼音风格
+索引版本 = 2                # 「编译热词」结果的结构版本，结构改变时加一，让磁盘缓存失效
+
+
+def 索引参数():
+    '''影响「编译热词」结果的参数，磁盘缓存以此和热词文本一起作为键'''
+    return f'{索引版本}|{多音字}|{风格}|{展开长度}|{模糊音}|{pypinyin_version}'
+
+def 热词格(热词拼音):
+    '''
+    把每个字的读音列表整理为「音节格」：每个位置是该字允许的读音，去掉重复
+
+    不展开各字读音的笛卡尔积，多音字多的长热词也只占与字数成正比的空间
+    '''
+    return [tuple(dict.fromkeys(多音)) for 多音 in 热词拼音]
+
 
 def 更新热词词典(热词文本: str):
     '''
@@ -47,24 +69,33 @@ def 更新热词词典(热词文本: str):
 
     heteronym: 是否启用多音字
 
+    每个热词对应一个音节格，每个位置是这个字允许的读音。
     如果启用了多音字，返回的词典是这样的形式：
         {'撒贝宁': [
-                    ['sā', 'bèi', 'níng'],
-                    ['sǎ', 'bèi', 'níng'],
-                    ['sā', 'bèi', 'nìng'],
-                    ['sǎ', 'bèi', 'nìng'],
-                    ['sā', 'bèi', 'zhù'],
-                    ['sǎ', 'bèi', 'zhù']
+                    ('sā', 'sǎ'),
+                    ('bèi', ),
+                    ('níng', 'nìng', 'zhù'),
                 ]
         }
     
     如果没有启用多音字，返回的词典是这样的形式：
         {'撒贝宁': [
-                    ['sā', 'bèi', 'níng'], 
+                    ('sā', ),
+                    ('bèi', ),
+                    ('níng', ),
                 ]
         }
     '''
-    global 热词词典; 热词词典.clear()
+    return 载入热词(编译热词(热词文本))
+
+
+def 编译热词(热词文本: str):
+    '''
+    计算热词的拼音并建好自动机，返回 (热词词典, 自动机, 模糊索引)，没打开模糊音时模糊索引为 None
+
+    不修改全局状态，结果可以序列化缓存，之后用「载入热词」发布
+    '''
+    新词典 = {}
     for 热词 in 热词文本.splitlines():
         热词 = 热词.strip()                             # 给热词去掉多余的空格
         if not 热词 or 热词.startswith('#'): continue   # 过滤掉注释
@@ -74,38 +105,140 @@ def 更新热词词典(热词文本: str):
             print(f'\x9b31m    热词「{热词}」得到的拼音数量与字数不符，抛弃\x9b0m')
             continue
 
-        拼音列表 = [[], ]
-        for 多音 in 热词拼音: 
-            音数 = len(多音)
-            if 音数 > 1:
-                原始列表, 拼音列表 = 拼音列表, []
-                for 音 in 多音:
-                    拼音列表.extend([x.copy() + [音] for x in 原始列表])
-            else:
-                for x in 拼音列表: x.append(多音[0])
-        
-        热词词典[热词] = 拼音列表
+        新词典[热词] = 热词格(热词拼音)
+
+    自动机 = 拼音自动机()
+    for 热词, 格 in 新词典.items():
+        自动机.添加(格, 热词)
+    自动机.构建()
+    return 新词典, 自动机, 模糊索引(新词典) if 模糊音 else None
+
+
+def 载入热词(编译结果) -> int:
+    '''发布编译好的热词，一次性替换引用，替换前的查询仍使用旧的，不会看到建了一半的'''
+    global 热词词典, _编译结果
+    _编译结果 = tuple(编译结果)      # 查询只读这一个引用，三者总是配套的
+    热词词典 = _编译结果[0]
     return len(热词词典)
 
 
+@lru_cache(maxsize=拼音缓存大小)
+def 字音(字: str, 风格: int, 多音字: bool):
+    '''单个字的所有读音，进程内按最近使用缓存，常用字几乎都能命中'''
+    return tuple(pinyin(字, 风格, 多音字)[0])
+
+
+def 拼音缓存统计():
+    '''返回单字读音缓存的命中次数、未命中次数和命中率'''
+    信息 = 字音.cache_info()
+    总数 = 信息.hits + 信息.misses
+    return {
+        'hits': 信息.hits,
+        'misses': 信息.misses,
+        'size': 信息.currsize,
+        'hit_rate': 信息.hits / 总数 if 总数 else 0.0,
+    }
+
+
+class 句子分析:
+    '''
+    一个句子的拼音和字符索引，只计算一次，供匹配和替换共用
+
+    音节列表：句子逐项的拼音（多音字取第一个读音），非汉字的连续片段是一项
+    索引：每一项在句子中起始字符的位置，对不上时为 None
+    '''
+
+    def __init__(self, 句子: str):
+        self.句子 = 句子
+        self.音节列表 = [x[0] for x in pinyin(句子, 风格, 多音字)] if 句子 else []
+        self.索引 = [None] * len(self.音节列表)
+        位置 = 0
+        for i, 字 in enumerate(句子):
+            if 位置 >= len(self.音节列表): break
+            音 = self.音节列表[位置]
+            if 音 in 字音(字, 风格, 多音字) or 音.startswith(字):
+                self.索引[位置] = i
+                位置 += 1
+
+    def 查找(self, 自动机=None):
+        '''返回所有匹配的 (起点, 终点, 热词)，区间以音节为单位'''
+        return (自动机 or _编译结果[1]).查找(self.音节列表)
+
+
 def 匹配热词(句子:str):
     '''
-    将全局「热词词典」中的热词按照拼音依次与句子匹配，将所有匹配到的「热词、拼音」以元组放到列表
+    用自动机在句子的音节序列上扫描一遍，将所有匹配到的「热词、拼音」以元组放到列表
     将列表返回
     '''
-    global 热词词典
-
+    分析 = 句子分析(句子)
     所有匹配 = []
-    句子拼音 = ''.join([x[0] for x in pinyin(句子, 风格, 多音字)])  # 字符串形式的句子拼音
-    for 词 in 热词词典.keys():
-        for 拼音序列 in 热词词典[词]:
-            if ''.join(拼音序列) in 句子拼音: 
-                所有匹配.append((词, 拼音序列))
-            else: 
-                continue
+    for 起, 止, 词 in 分析.查找():
+        if (词, 分析.音节列表[起:止]) not in 所有匹配:
+            所有匹配.append((词, 分析.音节列表[起:止]))
     return 所有匹配
 
 
+class 拼音自动机:
+    '''
+    以音节为字符的 Aho-Corasick 自动机
+
+    每个热词只把前「展开长度」个字的读音组合插入自动机，组合数最多是这几个字读音数的乘积；
+    其余的字保留为音节格，自动机命中前缀后，再逐个位置检查句子的音节是否在允许的读音里。
+    构建后对句子的音节序列从左到右扫描一遍，就能找出所有热词出现的位置，
+    耗时只与句子长度和匹配数有关，与热词数量无关
+    '''
+
+    def __init__(self):
+        self.转移 = [{}]      # 每个状态：音节 → 下一个状态
+        self.失败 = [0]
+        self.输出 = [[]]      # 每个状态：在此结束的 (热词, 前缀音节数, 尾部音节格)
+
+    def 添加(self, 格, 热词):
+        前缀, 尾部 = 格[:展开长度], tuple(frozenset(多音) for 多音 in 格[展开长度:])
+        for 拼音序列 in product(*前缀):
+            状态 = 0
+            for 音 in 拼音序列:
+                下一个 = self.转移[状态].get(音)
+                if 下一个 is None:
+                    下一个 = len(self.转移)
+                    self.转移[状态][音] = 下一个
+                    self.转移.append({}); self.失败.append(0); self.输出.append([])
+                状态 = 下一个
+            self.输出[状态].append((热词, len(前缀), 尾部))
+
+    def 构建(self):
+        '''按广度优先计算失败指针，并把失败状态的输出并入当前状态'''
+        队列 = list(self.转移[0].values())
+        for 状态 in 队列:
+            for 音, 下一个 in self.转移[状态].items():
+                回退 = self.失败[状态]
+                while 回退 and 音 not in self.转移[回退]:
+                    回退 = self.失败[回退]
+                self.失败[下一个] = self.转移[回退].get(音, 0)
+                self.输出[下一个] = self.输出[下一个] + self.输出[self.失败[下一个]]
+                队列.append(下一个)
+
+    def 查找(self, 音节列表):
+        '''返回所有匹配的 (起点, 终点, 热词)，区间左闭右开，以音节为单位'''
+        结果 = []
+        状态 = 0
+        for i, 音 in enumerate(音节列表):
+            while 状态 and 音 not in self.转移[状态]:
+                状态 = self.失败[状态]
+            状态 = self.转移[状态].get(音, 0)
+            for 热词, 长度, 尾部 in self.输出[状态]:
+                终点 = i + 1 + len(尾部)
+                if 终点 > len(音节列表): continue
+                for j, 允许 in enumerate(尾部, start=i + 1):
+                    if 音节列表[j] not in 允许: break
+                else:
+                    结果.append((i + 1 - 长度, 终点, 热词))
+        return 结果
+
+
+_编译结果 = ({}, 拼音自动机(), None)     # (热词词典, 自动机, 模糊索引)，更新时整体替换
+
+
 def 获取拼音索引(句子: str):
     '''
     输入句子字符串，获取一个列表，列表内是字典，字典包含了拼音和索引
@@ -117,15 +250,8 @@ def 获取拼音索引(句子: str):
         {'pinyin': 'nìng', 'index': 2 }, 
     ]
     '''
-    拼音带索引 = [{'pinyin': x[0], 'index': None} for x in pinyin(句子, 风格, 多音字)]
-    拼音带索引_ = iter(拼音带索引)
-    拼音 = next(拼音带索引_)
-    for i, 字 in enumerate(句子):
-        if 拼音['pinyin'] in pinyin(字, 风格, 多音字)[0] or 拼音['pinyin'].startswith(字):
-            拼音['index'] = i
-            try: 拼音 = next(拼音带索引_)
-            except: ...
-    return 拼音带索引
+    分析 = 句子分析(句子)
+    return [{'pinyin': 音, 'index': 索引} for 音, 索引 in zip(分析.音节列表, 分析.索引)]
 
 
 def 热词替换(句子):
@@ -133,27 +259,46 @@ def 热词替换(句子):
     从热词词典中查找匹配的热词，替换句子
 
     句子：       被查找和替换的句子
+
+    句子的拼音和字符索引只计算一次，自动机一遍扫描得到所有匹配，
+    重叠的匹配优先保留靠左的，起点相同时保留较长的
+
+    打开模糊音时，再加上模糊匹配的结果，精确匹配优先，其次是代价小的
     '''
-    所有匹配 = 匹配热词(句子)
-    for 匹配项 in 所有匹配:
-        热词, 拼音序列 = 匹配项  # 从字典中找到可以替换的热词和对应的拼音
-        
-        句子索引表 = 获取拼音索引(句子)
-        替换区间 = []
-        for i, item in enumerate(句子索引表):
-            for j, 音 in enumerate(拼音序列):
-                if i+j >= len(句子索引表): break
-                if 音 != 句子索引表[i+j]['pinyin']: break
-            else:
-                替换区间.append([句子索引表[i]['index'], 句子索引表[i+j]['index']])
-
-        for 区间 in 替换区间:
-            句子 = 句子[:区间[0]] + 热词 + 句子[区间[1]+1:]
+    # 整句只用同一份编译结果，热词更新不会影响进行中的替换
+    _, 自动机, 模糊 = _编译结果
+    if not 句子 or not 自动机.转移[0] and 模糊 is None: return 句子
+
+    分析 = 句子分析(句子)
+    所有匹配 = [(起, 止, 热词, 0) for 起, 止, 热词 in 分析.查找(自动机)]
+    if 模糊 is not None:
+        # 只有对得上汉字的音节参与模糊匹配，标点、英文、数字不算
+        所有匹配 += 模糊.查找([
+            音 if 索引 is not None and '一' <= 句子[索引] <= '龥' else None
+            for 音, 索引 in zip(分析.音节列表, 分析.索引)
+        ])
+    所有匹配.sort(key=lambda x: (x[3], x[0], x[0] - x[1]))
+
+    替换区间 = []
+    已占用 = set()
+    for 起, 止, 热词, _ in 所有匹配:
+        if 已占用.intersection(range(起, 止)): continue
+        开头, 结尾 = 分析.索引[起], 分析.索引[止 - 1]
+        if 开头 is None or 结尾 is None: continue
+        替换区间.append((开头, 结尾, 热词))
+        已占用.update(range(起, 止))
+    替换区间.sort()
+
+    # 从后往前替换，前面的字符索引不受影响
+    for 开头, 结尾, 热词 in reversed(替换区间):
+        句子 = 句子[:开头] + 热词 + 句子[结尾+1:]
 
     return 句子
 
 
 if __name__ == '__main__':
+    import random
+
     print(f'\x9b42m-------------开始---------------\x9b0m')
 
     热词文本 = '''
@@ -170,3 +315,70 @@ if __name__ == '__main__':
     t4 = time()
 
     print(f'{res=}    {t4-t3=}')
+
+    random.seed(0)
+    常用字 = '的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可也你能而子那得于着下自之年过发后作里'
+
+    # 大词表下「全部展开」与「音节格」的内存和耗时对比，模拟 2 万条公司词表，多音字较多
+    import tracemalloc
+    多音常用字 = '行长重乐还得着传朝调便参差给解了校和会系藏省数为应将'
+    热词集合 = {''.join(random.choice(常用字 + 多音常用字 * 2) for _ in range(random.randint(3, 7)))
+              for _ in range(20000)}
+    词表 = '\n'.join(热词集合)
+    句子 = '银行行长重新调整了参差不齐的还款计划，会计将数据传给总部。' * 4
+    for 名称, 长度 in (('全部展开', 99), ('音节格', 展开长度)):
+        展开长度, 原展开长度 = 长度, 展开长度
+        tracemalloc.start()
+        t1 = time()
+        更新热词词典(词表)
+        t2 = time()
+        内存 = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        for _ in range(20): 热词替换(句子)
+        t3 = time()
+        print(f'{名称}：{len(热词词典)} 条热词，自动机 {len(_编译结果[1].转移):8} 个状态，'
+              f'内存 {内存 / 1024 / 1024:6.1f}MB，构建 {t2 - t1:5.2f}s，每句 {(t3 - t2) / 20 * 1000:6.2f}ms')
+        展开长度 = 原展开长度
+
+    # 热词数量对单句耗时的影响：自动机扫描一遍句子，耗时应基本不随热词数增长
+    句子 = '今天我们请到了撒贝宁和康辉两位主持人，一起聊聊周涛在乐清的故事。' * 4
+    for 数量 in (10, 100, 1000, 5000):
+        虚构热词 = {''.join(random.sample(常用字, random.randint(2, 4))) for _ in range(数量)}
+        t1 = time()
+        更新热词词典(热词文本 + '\n'.join(虚构热词))
+        t2 = time()
+        for _ in range(20): 热词替换(句子)
+        t3 = time()
+        print(f'{len(热词词典):5} 条热词：构建 {(t2 - t1) * 1000:7.1f}ms，每句 {(t3 - t2) / 20 * 1000:6.2f}ms')
+
+    # 模糊音：平翘舌、前后鼻音、n/l 的近音错误也能替换成热词
+    模糊音 = True
+    更新热词词典('撒贝宁\n张家港\n金陵饭店\n刘德华\n周涛')
+    测试 = [
+        ('我见到了撒贝林', '我见到了撒贝宁'),          # ning/lin：n/l、前后鼻音
+        ('他去了赞家港', '他去了张家港'),              # zhang/zan：平翘舌、前后鼻音
+        ('住在金宁饭店', '住在金陵饭店'),              # ling/ning：n/l
+        ('牛德华唱歌', '刘德华唱歌'),                  # 声母韵母都不同，代价 1，三个字的热词容许 1
+        ('周涛', '周涛'),                              # 两个字的热词不做模糊匹配
+        ('撒，贝宁', '撒，贝宁'),                      # 不跨过标点
+        ('今天天气不错', '今天天气不错'),
+    ]
+    for 输入, 期望 in 测试:
+        输出 = 热词替换(输入)
+        assert 输出 == 期望, f'{输入!r} → {输出!r}，期望 {期望!r}'
+    print(f'模糊音 {len(测试)} 条用例通过')
+
+    # 模糊匹配的耗时：热词矩阵与句子逐行批量计算，循环次数只取决于热词的最大字数
+    句子 = '今天我们请到了撒贝林和康辉两位主持人，一起聊聊周涛在乐清的故事。' * 2
+    for 数量 in (100, 1000, 5000):
+        虚构热词 = {''.join(random.sample(常用字, random.randint(3, 5))) for _ in range(数量)}
+        更新热词词典(热词文本 + '\n'.join(虚构热词))
+        t1 = time()
+        for _ in range(20): 热词替换(句子)
+        t2 = time()
+        print(f'模糊音 {len(热词词典):5} 条热词：每句 {(t2 - t1) / 20 * 1000:6.2f}ms')
+    模糊音 = False
+
+    统计 = 拼音缓存统计()
+    print(f'单字读音缓存：命中 {统计["hits"]} 次，未命中 {统计["misses"]} 次，'
+          f'命中率 {统计["hit_rate"]:.1%}，缓存 {统计["size"]} 字')
@@ -0,0 +1,144 @@
+import unicodedata
+
+import numpy as np
+
+'''
+中文热词的模糊拼音匹配，供 hot_sub_zh 在「模糊音」打开时使用。
+
+识别结果里常见的近音错误，比如平翘舌（zh/z）、前后鼻音（in/ing）、n/l 不分，
+精确匹配拼音时都找不到热词。这里把每个音节拆成声母和韵母，按模糊音归类后编号：
+
+- 同一类里的声母或韵母视为相同，比如 zhang 和 zan 编号相同
+- 声母或韵母只有一个不同，代价 0.5；都不同，代价 1；多一个或少一个音节，代价 1
+
+每个热词有自己的允许代价：字数乘以「模糊比例」，少于「模糊最短」个字的热词不做模糊匹配，
+句子里匹配到的片段也至少要有「模糊最短」个音节，避免把热词的一小截补成整个热词。
+
+热词里每个字的读音（多音字是几个读音）记为一个「读音组」，不同的读音组通常只有几百个。
+每句先算出每个读音组对句子每个音节的替换代价，热词矩阵里只存读音组的编号，用时按编号取行。
+
+计算时把所有热词排成矩阵，与句子做半全局的编辑距离（热词可以从句子的任意位置开始）。
+动态规划按热词的字逐行推进，每一行对所有热词、句子的所有位置一次算完：
+替换和删除来自上一行，可以整体向量化；插入来自同一行的左边，
+相当于对「代价 - 位置」求前缀最小值，用 np.minimum.accumulate 一次完成。
+这样只需循环热词最大字数次，与热词数量、句子长度都是批量运算。
+
+动态规划之前先粗筛：热词每个字的代价至少是它与整句最接近的音节的替换代价（最多为 1，即删去这个字），
+这些下限加起来已经超过阈值的热词不可能匹配，不参与计算。
+
+为了同时得到匹配的起点，每个格子存一个整数：代价 × M + (M - 1 - 起点)，
+取最小值时先比代价，代价相同时取起点靠后、即较短的匹配。
+'''
+
+
+__all__ = ['模糊索引', '模糊声母', '模糊韵母']
+
+
+模糊声母 = {'zh': 'z', 'ch': 'c', 'sh': 's', 'n': 'l'}
+模糊韵母 = {'ang': 'an', 'eng': 'en', 'ing': 'in', 'iang': 'ian', 'uang': 'uan'}
+模糊比例 = 0.34     # 每个字允许的代价
+模糊最短 = 3        # 至少这么多字的热词才做模糊匹配
+最多读音 = 4        # 多音字最多比较的读音数
+
+声母表 = ('zh', 'ch', 'sh', 'b', 'p', 'm', 'f', 'd', 't', 'n', 'l',
+         'g', 'k', 'h', 'j', 'q', 'x', 'r', 'z', 'c', 's', 'y', 'w')
+
+_非拼音代价 = 100   # 标点、英文等不是拼音的位置，不允许出现在模糊匹配里
+
+
+def _拆分(音节: str):
+    '''去掉声调，拆成声母、韵母，并按模糊音归类'''
+    音节 = ''.join(c for c in unicodedata.normalize('NFD', 音节) if not unicodedata.combining(c)).lower()
+    声母 = next((x for x in 声母表 if 音节.startswith(x)), '')
+    韵母 = 音节[len(声母):]
+    return '声' + 模糊声母.get(声母, 声母), '韵' + 模糊韵母.get(韵母, 韵母)
+
+
+class 模糊索引:
+    def __init__(self, 热词词典: dict):
+        # 声母、韵母的编号表随索引一起保存，从磁盘缓存载入后编号仍然一致
+        self.编号 = {}
+        self._音节缓存 = {}
+        self.热词 = [词 for 词, 格 in 热词词典.items() if len(格) >= 模糊最短]
+        N = len(self.热词)
+        self.长度 = np.array([len(热词词典[词]) for 词 in self.热词], dtype=np.int64)
+        self.最长 = int(self.长度.max()) if N else 0
+        # 代价以 0.5 为单位存成整数
+        self.阈值 = np.floor(self.长度 * 模糊比例 * 2).astype(np.int64)
+        self.有效 = np.arange(self.最长) < self.长度[:, None]
+
+        # 读音组：一个字允许的读音编码，读音不足的用第一个读音补齐，不影响取最小值
+        读音组 = {}
+        self.组号 = np.zeros((N, self.最长), dtype=np.int32)
+        for n, 词 in enumerate(self.热词):
+            for i, 多音 in enumerate(热词词典[词]):
+                编码 = [self.编码(音, 新增=True) for 音 in 多音[:最多读音]]
+                编码 = tuple(编码 + [编码[0]] * (最多读音 - len(编码)))
+                self.组号[n, i] = 读音组.setdefault(编码, len(读音组))
+        组 = np.array(list(读音组), dtype=np.int32).reshape(len(读音组), 最多读音, 2)
+        self.组声母, self.组韵母 = 组[..., 0], 组[..., 1]
+
+    def 编码(self, 音节: str, 新增: bool = False):
+        '''音节的 (声母, 韵母) 编号，热词里没出现过的声母、韵母编为 -1，与任何热词都不同'''
+        编码 = self._音节缓存.get(音节)
+        if 编码 is None:
+            if 新增:
+                编码 = tuple(self.编号.setdefault(x, len(self.编号)) for x in _拆分(音节))
+                self._音节缓存[音节] = 编码
+            else:
+                编码 = tuple(self.编号.get(x, -1) for x in _拆分(音节))
+                if len(self._音节缓存) < 8192:
+                    self._音节缓存[音节] = 编码
+        return 编码
+
+    def 查找(self, 句子音节):
+        '''
+        句子音节：句子逐项的拼音，不是汉字的项为 None
+
+        返回所有在阈值内的 (起点, 终点, 热词, 代价)，代价以 0.5 为单位，区间以音节为单位
+        '''
+        S = len(句子音节)
+        if not self.热词 or S == 0:
+            return []
+        句子编码 = [self.编码(音) if 音 is not None else (-1, -1) for 音 in 句子音节]
+        句声 = np.array([x[0] for x in 句子编码], dtype=np.int32)
+        句韵 = np.array([x[1] for x in 句子编码], dtype=np.int32)
+        非拼音位置 = np.array([音 is None for 音 in 句子音节])
+        # 前缀计数，用来排除跨过标点、英文的匹配（插入一个音节只计代价 1，单靠代价拦不住）
+        非拼音累计 = np.concatenate(([0], np.cumsum(非拼音位置)))
+
+        # 每个读音组对句子每个音节的替换代价，(读音组数, S)
+        组代价 = ((self.组声母[..., None] != 句声).astype(np.int64) + (self.组韵母[..., None] != 句韵)).min(axis=1)
+        组代价[:, 非拼音位置] = _非拼音代价
+
+        # 粗筛：每个字至少要付出与整句最接近的音节的替换代价，最多是删去这个字的代价
+        下限 = np.minimum(组代价.min(axis=1), 2)[self.组号]
+        候选 = np.flatnonzero(np.where(self.有效, 下限, 0).sum(axis=1) <= self.阈值)
+        if not len(候选):
+            return []
+        组号, 长度 = self.组号[候选], self.长度[候选]
+
+        M = S + 2
+        位置 = np.arange(S + 1, dtype=np.int64)
+        横移 = 2 * M * 位置
+        上一行 = np.broadcast_to(M - 1 - 位置, (len(候选), S + 1))
+        结果 = []
+        for i in range(int(长度.max())):
+            替换 = 组代价[组号[:, i]]
+
+            当前 = 上一行 + 2 * M                                       # 热词的字被跳过
+            当前[:, 1:] = np.minimum(当前[:, 1:], 上一行[:, :-1] + 替换 * M)
+            当前 = np.minimum.accumulate(当前 - 横移, axis=1) + 横移      # 句子多出音节
+            上一行 = 当前
+
+            # 字数恰好为 i + 1 的热词，这一行就是最终代价
+            热词序号 = np.flatnonzero(长度 == i + 1)
+            if not len(热词序号):
+                continue
+            代价 = 当前[热词序号] // M
+            行, 终点 = np.nonzero(代价 <= self.阈值[候选[热词序号], None])
+            起点 = M - 1 - 当前[热词序号[行], 终点] % M
+            for n, 起, 止, c in zip(候选[热词序号[行]], 起点, 终点, 代价[行, 终点]):
+                if 止 - 起 >= 模糊最短 and 非拼音累计[止] == 非拼音累计[起]:
+                    结果.append((int(起), int(止), self.热词[n], int(c)))
+        return 结果
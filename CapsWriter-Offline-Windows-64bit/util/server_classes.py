@@ -1,3 +1,9 @@
+import copy
+import re
+
+import numpy as np
+
+
 class Task:
     def __init__(self, source: str,
                  data,
@@ -21,6 +27,15 @@ class Task:
 
 
 class Result:
+    '''
+    一个任务的识别结果，逐个片段累积
+
+    token 的文字和时间戳只追加不修改：文字按 token 逐个渲染成片段，追加时只处理新的 token；
+    时间戳存在按容量倍增的数组里。合并后的文字分成两段：
+    已经调整过格式的部分，和还没调整格式的 token（从 formatted_upto 开始），
+    每个片段只处理新追加的内容，长音频的总耗时与时长成正比。
+    '''
+
     def __init__(self, task_id, socket_id, source) -> None:
         self.task_id = task_id          # 任务 id
         self.socket_id = socket_id      # socket id
@@ -32,6 +47,88 @@ class Result:
         self.time_complete = 0          # 识别完成时间
 
         self.tokens = []                # 字级 token
-        self.timestamps = []            # 字级 token 的时间戳
+        self._timestamps = np.zeros(256)    # 字级 token 的时间戳，只有前 len(tokens) 个有效
+        self._pieces = []               # 每个 token 渲染出的文字，含它前面的空格
+        self._formatted = []            # 已调整格式的文字
+        self.formatted_upto = 0         # 第几个 token 之前的文字已调整格式
         self.text = ''                  # 合并的文字
         self.is_final = False           # 是否已完成所有片段识别
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:len(self.tokens)]
+
+    def append(self, tokens, timestamps):
+        '''追加新识别的 token，只渲染新 token 的文字'''
+        count = len(self.tokens)
+        if count + len(tokens) > len(self._timestamps):
+            grown = np.zeros(max(2 * len(self._timestamps), count + len(tokens)))
+            grown[:count] = self._timestamps[:count]
+            self._timestamps = grown
+        self._timestamps[count:count + len(tokens)] = timestamps
+
+        pieces = self._pieces
+        for token in tokens:
+            if not pieces:
+                pieces.append(token)
+            elif pieces[-1].endswith('@@'):
+                # 「@@」表示与后一个 token 是同一个词，去掉标记、不加空格
+                pieces[-1] = pieces[-1][:-2]
+                pieces.append(token)
+            elif _tight(pieces[-1][-1:], token[:1]):
+                pieces.append(token)
+            else:
+                pieces.append(' ' + token)
+            self.tokens.append(token)
+
+    def pending(self, end=None) -> str:
+        '''还没调整格式的文字，从 formatted_upto 到 end 个 token'''
+        return ''.join(self._pieces[self.formatted_upto:end]).lstrip(' ')
+
+    def commit(self, formatted: str, end: int, seam: str = ''):
+        '''记下 end 个 token 之前的文字调整格式后的结果，seam 是它与前一段之间的连接符'''
+        self._formatted.append(seam + formatted)
+        self.formatted_upto = end
+
+    def separator(self, index: int = None) -> str:
+        '''第 index 个 token 与它前面的 token 之间，原文里的分隔符（空格或空），默认取未调整格式的第一个 token'''
+        index = self.formatted_upto if index is None else index
+        if not 0 < index < len(self._pieces):
+            return ''
+        piece = self._pieces[index]
+        return piece[:len(piece) - len(piece.lstrip(' '))]
+
+    def formatted_tail(self, size: int = 1) -> str:
+        '''已调整格式的文字的最后 size 个字'''
+        tail = ''
+        for chunk in reversed(self._formatted):
+            tail = chunk + tail
+            if len(tail) >= size:
+                break
+        return tail[-size:]
+
+    def merged_text(self) -> str:
+        # 未调整格式的部分保留开头的空格，与已调整的部分之间不会粘连
+        tail = ''.join(self._pieces[self.formatted_upto:])
+        return ''.join(self._formatted) + tail if self._formatted else tail.lstrip(' ')
+
+    def snapshot(self) -> 'Result':
+        '''当前状态的副本，放进队列后原对象继续追加也不会影响它'''
+        return copy.copy(self)
+
+    def __getstate__(self):
+        # 结果发回主进程只为发送消息，不带追加用的缓冲区
+        state = self.__dict__.copy()
+        state['tokens'] = list(self.tokens)
+        state['_timestamps'] = self.timestamps.copy()
+        state['_pieces'] = []
+        state['_formatted'] = []
+        return state
+
+
+def _tight(left: str, right: str) -> bool:
+    '''两个 token 之间是否不加空格：前一个结尾和后一个开头都不是英文字母和数字'''
+    return not _ALNUM.match(left) and not _ALNUM.match(right)
+
+
+_ALNUM = re.compile('[a-zA-Z0-9]')
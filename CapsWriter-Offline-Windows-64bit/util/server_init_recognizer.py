@@ -1,4 +1,5 @@
 import time
+from queue import Empty
 import sherpa_onnx
 from multiprocessing import Queue
 import signal
@@ -6,7 +7,8 @@ from platform import system
 from config import ServerConfig as Config
 from config import ParaformerArgs, ModelPaths
 from util.server_cosmic import console
-from util.server_recognize import recognize
+from util.server_recognize import recognize_batch
+from util.chinese_itn import load_idioms
 from util.empty_working_set import empty_current_working_set
 
 
@@ -18,6 +20,22 @@ def disable_jieba_debug():
     jieba.setLogLevel(logging.INFO)
 
 
+def collect_tasks(queue_in: Queue, batch_size: int, batch_wait: float):
+    '''
+    取出一批任务：阻塞最多 1 秒等第一个，之后在 batch_wait 秒内尽量凑满 batch_size 个
+
+    队列里已经积压的任务直接取走，不用等待；只有一个客户端在说话时最多多等 batch_wait 秒
+    '''
+    tasks = [queue_in.get(timeout=1)]
+    deadline = time.time() + batch_wait
+    while len(tasks) < batch_size:
+        try:
+            tasks.append(queue_in.get(timeout=max(deadline - time.time(), 0)))
+        except Empty:
+            break
+    return tasks
+
+
 def init_recognizer(queue_in: Queue, queue_out: Queue, sockets_id):
 
     # Ctrl-C 退出
@@ -46,23 +64,33 @@ def init_recognizer(queue_in: Queue, queue_out: Queue, sockets_id):
 
     console.print(f'模型加载耗时 {time.time() - t1 :.2f}s', end='\n\n')
 
+    # 追加常用语，其中的数字不转换
+    if Config.format_num:
+        num_idioms = load_idioms(getattr(Config, 'format_num_idioms', 'idioms.txt'))
+        console.print(f'已载入 [green4]{num_idioms}[/] 条常用语', end='\n\n')
+
     # 清空物理内存工作集
     if system() == 'Windows':
         empty_current_working_set()
 
     queue_out.put(True)  # 通知主进程加载完了
 
+    batch_size = max(1, getattr(Config, 'batch_size', 1))
+    batch_wait = getattr(Config, 'batch_wait', 0.0)
+
     while True:
-        # 从队列中获取任务消息
+        # 从队列中获取一批任务消息
         # 阻塞最多1秒，便于中断退出
         try:
-            task = queue_in.get(timeout=1)       
+            tasks = collect_tasks(queue_in, batch_size, batch_wait)
         except:
             continue
 
-        if task.socket_id not in sockets_id:    # 检查任务所属的连接是否存活
+        # 检查任务所属的连接是否存活
+        tasks = [task for task in tasks if task.socket_id in sockets_id]
+        if not tasks:
             continue
 
-        result = recognize(recognizer, punc_model, task)   # 执行识别
-        queue_out.put(result)      # 返回结果
+        for result in recognize_batch(recognizer, punc_model, tasks):   # 执行识别
+            queue_out.put(result)      # 返回结果
 
@@ -1,32 +1,140 @@
 import re
 import time
+from typing import List
 
 import numpy as np 
 
 from util.server_cosmic import console
 from config import ServerConfig as Config
 from util.server_classes import Task, Result
-from util.chinese_itn import chinese_to_num
+from util.chinese_itn import chinese_to_num, has_numeral
 from util.format_tools import adjust_space
+from util.text_pipeline import HAS_ALNUM_SPACE, Stage, TextPipeline
 from rich import inspect
 
 
 results = {}
 
 
-def format_text(text, punc_model):
+# 转录长文件时，不等到最后才调整整篇的格式：未调整的文字够长时，在其中最长的停顿处切开，
+# 停顿之前的先调整格式。停顿是自然的句子边界，标点模型在此断句不会割裂句子；
+# 最后一个片段到达时，只需调整最后一次切分之后的文字
+FORMAT_MIN_CHARS = 200      # 未调整格式的文字达到这么多字才尝试切分
+FORMAT_MAX_CHARS = 2000     # 超过这么多字，即使没有足够长的停顿也在最长的停顿处切分
+FORMAT_PAUSE = 0.6          # 相邻 token 的时间戳相差这么多秒，视为停顿
+
+
+_format_pipelines = {}
+
+
+def _build_format_pipeline(punc_model) -> TextPipeline:
+    stages = []
     if Config.format_spell:
-        text = adjust_space(text)       # 调空格
-    if Config.format_punc and punc_model and text:
-        text = punc_model(text)[0]  # 加标点
+        stages.append(Stage('调空格（前）', adjust_space, requires=HAS_ALNUM_SPACE))
+    if Config.format_punc and punc_model:
+        stages.append(Stage('加标点', lambda text: punc_model(text)[0]))
     if Config.format_num:
-        text = chinese_to_num(text)     # 转数字
+        stages.append(Stage('转数字', chinese_to_num, requires=has_numeral))
     if Config.format_spell:
-        text = adjust_space(text)       # 调空格
-    return text
+        stages.append(Stage('调空格（后）', adjust_space, requires=HAS_ALNUM_SPACE))
+    return TextPipeline(stages)
+
+
+def format_text(text, punc_model):
+    # 流水线按标点模型构建一次，之后复用；各步骤的耗时见 format_pipeline(punc_model).report()
+    return format_pipeline(punc_model)(text)
+
+
+def format_pipeline(punc_model) -> TextPipeline:
+    pipeline = _format_pipelines.get(id(punc_model))
+    if pipeline is None:
+        pipeline = _format_pipelines[id(punc_model)] = _build_format_pipeline(punc_model)
+    return pipeline
+
+
+def _format_cut(result: Result):
+    '''在未调整格式的 token 中找切分位置，返回切分后第一个 token 的序号，不切分时返回 None'''
+    start, end = result.formatted_upto, len(result.tokens)
+    if end - start < 2 or len(result.pending()) < FORMAT_MIN_CHARS:
+        return None
+    gaps = np.diff(result.timestamps[start:end])
+    # 被「@@」连接的 token 属于同一个词，不能在中间切开
+    gaps[[token.endswith('@@') for token in result.tokens[start:end - 1]]] = -1
+    candidates = gaps
+    if Config.format_spell:
+        # adjust_space 会连带处理英文、数字两侧的字，只在原文不加空格的 token 之间（两侧都不是英文、数字）切分，
+        # 分段调整的结果才与整篇调整相同
+        spaced = [bool(result.separator(i)) for i in range(start + 1, end)]
+        candidates = np.where(spaced, -1, gaps)
+    i = int(np.argmax(candidates))
+    if candidates[i] < FORMAT_PAUSE:
+        if len(result.pending()) < FORMAT_MAX_CHARS:
+            return None
+        if candidates[i] < 0:
+            i = int(np.argmax(gaps))    # 太长又找不到这样的位置，只好在英文、数字之间切分
+    return start + i + 1
+
+
+SEAM_CONTEXT = 32          # 确定接缝处的空格时，取两侧各这么多字做上下文
+
+
+def _seam(left: str, raw: str, right: str) -> str:
+    '''
+    分段调整格式时，两段之间的连接符
+
+    raw 是原文里两段之间的分隔符，left、right 是接缝两侧已调整格式的文字。
+    每段单独调整格式会去掉段首的空格，这里补回原文的分隔符；
+    开启 format_spell 时，整篇调整会让 adjust_space 处理接缝两侧，只在它会改动接缝时采用它的结果
+    '''
+    if not left or not right:
+        return ''
+    if not Config.format_spell:
+        return raw
+    whole = adjust_space(left + raw + right)
+    left, right = adjust_space(left), adjust_space(right)
+    if whole.startswith(left) and whole.endswith(right) and len(whole) - len(left) - len(right) in (0, 1):
+        return whole[len(left):len(whole) - len(right)]
+    return raw
+
+
+def _commit(result: Result, punc_model, end: int):
+    '''调整 end 个 token 之前未调整的文字的格式，接在已调整的文字后面'''
+    formatted = format_text(result.pending(end), punc_model)
+    if result.formatted_upto:
+        formatted = formatted.lstrip(' ')     # 段首的空格由连接符决定
+    seam = _seam(result.formatted_tail(SEAM_CONTEXT), result.separator(), formatted[:SEAM_CONTEXT])
+    result.commit(formatted, end, seam)
 
 
 def recognize(recognizer, punc_model, task: Task):
+    return recognize_batch(recognizer, punc_model, [task])[0]
+
+
+def recognize_batch(recognizer, punc_model, tasks: List[Task]) -> List[Result]:
+    '''
+    一次识别多个片段，多个片段时用 decode_streams 合并成一批推理
+
+    片段可以来自不同任务，也可以是同一任务的相邻片段；
+    识别之后按传入的顺序逐个合并结果，同一任务的片段仍按提交顺序拼接，
+    返回每个片段合并后的结果副本
+    '''
+    streams = []
+    for task in tasks:
+        stream = recognizer.create_stream()
+        stream.accept_waveform(task.samplerate, np.frombuffer(task.data, dtype=np.float32))
+        streams.append(stream)
+
+    if len(streams) == 1:
+        recognizer.decode_stream(streams[0])
+    else:
+        recognizer.decode_streams(streams)
+
+    # 同一任务的结果对象会被后面的片段继续修改（同一批里可能就有它的下一个片段），
+    # 队列也是在后台线程里才序列化，所以每合并一个片段就取一份副本返回
+    return [merge_result(punc_model, task, stream).snapshot() for task, stream in zip(tasks, streams)]
+
+
+def merge_result(punc_model, task: Task, stream) -> Result:
 
     # inspect({key:value for key, value in task.__dict__.items() if not key.startswith('_') and key != 'data'})
     # todo 清空遗存的任务结果
@@ -38,18 +146,12 @@ def recognize(recognizer, punc_model, task: Task):
     # 取出结果容器
     result = results[task.task_id]
 
-    # 片段预处理
-    samples = np.frombuffer(task.data, dtype=np.float32)
-    duration = len(samples) / task.samplerate
+    # 片段时长
+    duration = len(task.data) / 4 / task.samplerate
     result.duration += duration - task.overlap
     if task.is_final:
         result.duration += task.overlap
 
-    # 识别片段
-    stream = recognizer.create_stream()
-    stream.accept_waveform(task.samplerate, samples)
-    recognizer.decode_stream(stream)
-
     # 记录识别时间
     result.time_start = task.time_start
     result.time_submit = task.time_submit
@@ -65,7 +167,7 @@ def recognize(recognizer, punc_model, task: Task):
         n = i
         if timestamp > duration - task.overlap / 2:
             break
-    if not result.timestamps:
+    if not result.tokens:
         m = 0
     if task.is_final:
         n = len(stream.result.timestamps)
@@ -76,24 +178,64 @@ def recognize(recognizer, punc_model, task: Task):
     elif result.tokens and result.tokens[-1:] == stream.result.tokens[m:n][:1]:
         m += 1
 
-    # 最后与先前的结果合并
-    result.timestamps += [t + task.offset for t in stream.result.timestamps[m:n]]
-    result.tokens += [token for token in stream.result.tokens[m:n]]
-
-    # token 合并为文本
-    text = ' '.join(result.tokens).replace('@@ ', '')
-    text = re.sub('([^a-zA-Z0-9]) (?![a-zA-Z0-9])', r'\1', text)
-
-    result.text = text
+    # 最后与先前的结果合并，只处理新增的 token
+    result.append(stream.result.tokens[m:n], np.asarray(stream.result.timestamps[m:n]) + task.offset)
 
     if not task.is_final:
+        # 长文件转录时，先调整停顿之前的文字的格式
+        if result.source == 'file':
+            cut = _format_cut(result)
+            if cut is not None:
+                _commit(result, punc_model, cut)
+        result.text = result.merged_text()
         return result
 
-    # 调整文本格式
-    result.text = format_text(text, punc_model)
+    # 调整尚未调整格式的文字
+    _commit(result, punc_model, len(result.tokens))
+    result.text = result.merged_text()
 
     # 若最后一个片段完成识别，从字典摘取任务
     result = results.pop(task.task_id)
     result.is_final = True
 
     return result
+
+
+def _check_seams(trials=2000):
+    '''
+    分段调整格式的结果应与整篇一次调整相同：不加标点、不转数字，在数字、字母、汉字之间随机切分。
+    开启 format_spell 时只在 _format_cut 会选的位置（原文不加空格处）切分
+    '''
+    import random
+    vocabulary = ['百', '的', '我', '三', '，', '3', '25', 'hello', 'world', 'a', 'b', 'x', 'ok@@', 'ay']
+    saved = Config.format_spell, Config.format_num
+    Config.format_num = False
+    try:
+        for spell in (True, False):
+            Config.format_spell = spell
+            _format_pipelines.clear()
+            rand = random.Random(0)
+            for _ in range(trials):
+                tokens = [rand.choice(vocabulary) for _ in range(rand.randint(2, 30))]
+                if tokens[-1].endswith('@@'):
+                    tokens[-1] = tokens[-1][:-2]
+                text = re.sub('([^a-zA-Z0-9]) (?![a-zA-Z0-9])', r'\1', ' '.join(tokens).replace('@@ ', ''))
+                expected = format_text(text, None)
+
+                result = Result('check', 'check', 'file')
+                result.append(tokens, np.arange(len(tokens)))
+                cuts = [i for i in range(1, len(tokens))
+                        if not tokens[i - 1].endswith('@@') and not (spell and result.separator(i))]
+                for cut in sorted(rand.sample(cuts, min(len(cuts), rand.randint(1, 4)))):
+                    _commit(result, None, cut)
+                _commit(result, None, len(tokens))
+                # 文字以英文开头时，adjust_space 会按结尾的字决定是否在最前面加空格，这个空格不比较
+                assert result.merged_text().lstrip() == expected.lstrip(), (spell, tokens, result._formatted, expected)
+    finally:
+        Config.format_spell, Config.format_num = saved
+        _format_pipelines.clear()
+    console.print('分段调整格式与整篇调整一致')
+
+
+if __name__ == '__main__':
+    _check_seams()
@@ -31,7 +31,7 @@ async def ws_send():
                 'time_submit': result.time_submit,
                 'time_complete': result.time_complete,
                 'tokens': result.tokens,
-                'timestamps': result.timestamps,
+                'timestamps': result.timestamps.tolist(),
                 'text': result.text,
                 'is_final': result.is_final,
             }
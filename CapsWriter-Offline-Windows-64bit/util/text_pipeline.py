@@ -0,0 +1,85 @@
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+
+'''
+识别结果的后处理流水线，客户端的热词替换、服务端的格式整理都用它组织。
+
+流水线在启动时按配置构建一次，由若干步骤组成，每一步是一个 文本 → 文本 的函数：
+
+- 配置里关闭的步骤在构建时就不加入，调用时不再逐个判断开关
+- 每一步可以声明一个「需要」的正则，文本里没有相关字符时直接跳过，
+  比如没有汉字就不做中文热词替换，没有字母数字就不做英文热词替换。
+  同一个正则的检查结果在一次调用里共用，只有文本被前面的步骤改动后才重新检查
+- 每一步累计调用次数、跳过次数和耗时，report() 可以看出时间花在哪一步
+
+用法：
+
+    pipeline = TextPipeline([
+        Stage('热词', 热词替换, requires=HAS_CJK),
+        Stage('去标点', strip_punc),
+    ])
+    text = pipeline(text)
+    print(pipeline.report())
+'''
+
+
+__all__ = ['HAS_CJK', 'HAS_ALNUM', 'HAS_ALNUM_SPACE', 'Stage', 'TextPipeline']
+
+
+HAS_CJK = re.compile(r'[一-龥]')
+HAS_ALNUM = re.compile(r'[a-zA-Z0-9]')
+HAS_ALNUM_SPACE = re.compile(r'[a-zA-Z0-9 ]')
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[str], str], requires: Optional[re.Pattern] = None):
+        self.name = name
+        self.func = func
+        self.requires = requires
+        self.calls = 0
+        self.skips = 0
+        self.seconds = 0.0
+
+
+class TextPipeline:
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+
+    def __call__(self, text: str) -> str:
+        if not text:
+            return text
+        checked: Dict[re.Pattern, bool] = {}
+        for stage in self.stages:
+            if stage.requires is not None:
+                found = checked.get(stage.requires)
+                if found is None:
+                    found = checked[stage.requires] = stage.requires.search(text) is not None
+                if not found:
+                    stage.skips += 1
+                    continue
+            t1 = time.perf_counter()
+            result = stage.func(text)
+            stage.seconds += time.perf_counter() - t1
+            stage.calls += 1
+            if result != text:
+                checked.clear()
+                text = result
+        return text
+
+    def reset_stats(self):
+        for stage in self.stages:
+            stage.calls = stage.skips = 0
+            stage.seconds = 0.0
+
+    def report(self) -> str:
+        total = sum(stage.seconds for stage in self.stages) or 1e-12
+        lines = [f'{"步骤":<10}{"调用":>8}{"跳过":>8}{"总耗时":>12}{"平均":>10}{"占比":>8}']
+        for stage in self.stages:
+            average = stage.seconds / stage.calls * 1000 if stage.calls else 0
+            lines.append(
+                f'{stage.name:<10}{stage.calls:>8}{stage.skips:>8}'
+                f'{stage.seconds * 1000:>10.1f}ms{average:>8.2f}ms{stage.seconds / total:>8.0%}'
+            )
+        return '\n'.join(lines)